@@ -1,11 +1,120 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import (Question,
                      Answer,
+                     ArchivedVote,
                      Vote)
 
+# до этого числа строк по статистике таблицы список считается точным COUNT
+EXACT_COUNT_LIMIT = getattr(settings, 'POLLS_ADMIN_EXACT_COUNT_LIMIT', 10000)
 
-# Регистрируем модели в админке Django
-admin.site.register(Question)
-admin.site.register(Answer)
-admin.site.register(Vote)
+
+def estimated_count(model, using):
+    """
+    Число строк таблицы модели по статистике PostgreSQL (pg_class.reltuples)
+    или None для других СУБД и таблиц без собранной статистики
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                       [connection.ops.quote_name(model._meta.db_table)])
+        row = cursor.fetchone()
+    if row is None or row[0] <= 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списков админки для больших таблиц: число строк списка без
+    фильтров и поиска берется из статистики таблицы вместо COUNT(*)
+    по всей таблице. Отфильтрованные списки и небольшие таблицы считаются точно
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Основа админки таблиц с миллионами строк: оценка числа строк вместо
+    двух COUNT(*) на страницу и сортировка только по первичному ключу
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    sortable_by = ()
+
+
+class AnswerInline(admin.TabularInline):
+    model = Answer
+    extra = 0
+
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    list_display = ('title', 'owner', 'date_start', 'date_end', 'pub_date')
+    list_select_related = ('owner',)
+    raw_id_fields = ('owner',)
+    # поиск нужен для выбора опроса в autocomplete_fields
+    search_fields = ('title',)
+    inlines = (AnswerInline,)
+
+
+@admin.register(Answer)
+class AnswerAdmin(admin.ModelAdmin):
+    list_display = ('answer_text', 'question')
+    list_select_related = ('question',)
+    autocomplete_fields = ('question',)
+    search_fields = ('answer_text',)
+
+
+@admin.register(Vote)
+class VoteAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'question', 'answer', 'created')
+    list_select_related = ('user', 'question', 'answer')
+    raw_id_fields = ('user', 'answer')
+    autocomplete_fields = ('question',)
+    # фильтр по времени голосования идет по индексу created; список опросов
+    # в фильтре не строится, голоса опроса отбираются параметром ?question__id__exact=<id>
+    list_filter = ('created',)
+
+
+@admin.register(ArchivedVote)
+class ArchivedVoteAdmin(VoteAdmin):
+    """
+    Голоса архивированных опросов, такая же по размеру таблица, как Vote
+    """
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class LargeUserAdmin(UserAdmin, LargeTableAdmin):
+    """
+    Админка пользователей: поиск по началу имени пользователя идет
+    по индексу уникальности, фильтры по неиндексированным флагам убраны
+    """
+    list_filter = ('groups',)
+    search_fields = ('username',)
+    ordering = ('username',)
+    sortable_by = ('username',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(username__startswith=search_term), False
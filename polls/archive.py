@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils.timezone import now
+
+from .models import (Answer,
+                     AnswerSnapshot,
+                     ArchivedVote,
+                     PendingVote,
+                     Question,
+                     QuestionSnapshot,
+                     QuestionTally,
+                     Vote,
+                     VoteTally,
+                     Watermark)
+from .rollups import ROLLUP_WATERMARK
+
+# опросы архивируются не сразу после закрытия: голоса, проверенные
+# незадолго до закрытия, могут еще записываться
+ARCHIVE_GRACE = timedelta(seconds=getattr(settings, 'POLLS_ARCHIVE_GRACE', 3600))
+
+ARCHIVE_BATCH_SIZE = getattr(settings, 'POLLS_ARCHIVE_BATCH_SIZE', 5000)
+
+
+def archive_polls(batch_size=ARCHIVE_BATCH_SIZE, grace=ARCHIVE_GRACE):
+    """
+    Фиксирует итоги опросов, закрытых раньше чем grace назад, и переносит
+    их голоса из Vote в ArchivedVote порциями по batch_size.
+    Возвращает пару (число архивированных опросов, число перенесенных голосов)
+    """
+    questions = list(Question.objects.filter(
+        date_end__lt=now() - grace, snapshot__isnull=True
+    ).exclude(
+        # голоса из очереди еще не записаны в Vote
+        pendingvote__state=PendingVote.PENDING
+    ).values_list('id', flat=True).order_by('id'))
+    for question_id in questions:
+        snapshot_question(question_id)
+    return len(questions), move_votes(batch_size)
+
+
+def snapshot_question(question_id):
+    """
+    Записывает итоги опроса по его голосам и удаляет счетчики опроса:
+    статистика закрытого опроса дальше читается из итогов
+    """
+    with transaction.atomic():
+        list(VoteTally.objects.select_for_update().filter(
+            question_id=question_id).values_list('pk', flat=True))
+        counts = dict(Vote.objects.filter(question_id=question_id).values('answer').annotate(
+            count=Count('id')).values_list('answer', 'count').order_by())
+        AnswerSnapshot.objects.bulk_create(
+            AnswerSnapshot(question_id=question_id, answer_id=answer_id,
+                           count=counts.get(answer_id, 0))
+            for answer_id in Answer.objects.filter(
+                question_id=question_id).values_list('id', flat=True))
+        QuestionSnapshot.objects.create(question_id=question_id, total=sum(counts.values()))
+        VoteTally.objects.filter(question_id=question_id).delete()
+        QuestionTally.objects.filter(question_id=question_id).delete()
+
+
+def move_votes(batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Переносит голоса архивированных опросов в ArchivedVote, каждая порция
+    в своей транзакции. Голоса, еще не учтенные в сводках compact_rollups,
+    не переносятся. Возвращает число перенесенных голосов
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            votes = Vote.objects.select_for_update(of=('self',)).filter(
+                question__snapshot__isnull=False)
+            position = Watermark.objects.filter(
+                name=ROLLUP_WATERMARK).values_list('position', flat=True).first()
+            if position is not None:
+                votes = votes.filter(id__lte=position)
+            batch = [ArchivedVote(id=vote_id, user_id=user_id, question_id=question_id,
+                                  answer_id=answer_id, created=created)
+                     for vote_id, user_id, question_id, answer_id, created in votes.values_list(
+                         'id', 'user', 'question', 'answer', 'created').order_by('id')[:batch_size]]
+            ArchivedVote.objects.bulk_create(batch)
+            Vote.objects.filter(id__in=[vote.id for vote in batch]).delete()
+        moved += len(batch)
+        if len(batch) < batch_size:
+            return moved
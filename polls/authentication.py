@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+from .routers import primary_reads
+
+
+class TokenCache(object):
+    """
+    Ограниченный по размеру LRU кэш токенов с временем жизни записей.
+    Кэш локален для процесса, поэтому время жизни ограничивает устаревание
+    записей в воркерах, не получивших сигнал об изменении
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            keys = [key for key, (_, (_, token)) in self._items.items()
+                    if token['user_id'] == user_id]
+            for key in keys:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items)}
+
+
+token_cache = TokenCache(getattr(settings, 'POLLS_TOKEN_CACHE_SIZE', 10000),
+                         getattr(settings, 'POLLS_TOKEN_CACHE_TTL', 300))
+
+
+def _field_values(instance):
+    return {field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields}
+
+
+def _from_values(model, values):
+    return model.from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, запоминающая пользователя по ключу токена,
+    чтобы не выполнять запрос Token и User на каждый запрос. Токен читается
+    из основной БД: реплика могла еще не получить новый токен или его удаление.
+    В кэше хранятся значения полей, и каждый запрос получает новые экземпляры,
+    чтобы кэши прав и атрибуты запроса не переходили между потоками и запросами
+    """
+    def authenticate_credentials(self, key):
+        values = token_cache.get(key)
+        if values is None:
+            with primary_reads():
+                user, token = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            token_cache.set(key, (_field_values(user), _field_values(token)))
+            return user, token
+        user = _from_values(get_user_model(), values[0])
+        token = _from_values(self.get_model(), values[1])
+        token.user = user
+        return user, token
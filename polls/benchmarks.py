@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from itertools import islice
+from datetime import timedelta
+from uuid import uuid4
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import QueryRecorder, record_queries
+from .mmapcache import MmapCache
+from .models import Answer, Question, Vote
+from .renderers import FastJSONRenderer
+from .serializers import QuestionListSerializer, StatisticSerializer
+from .tallies import rebuild_tallies
+from .views import QuestionList, StatisticView
+
+BENCH_PREFIX = 'bench_'
+BENCH_ADMIN = 'bench_admin'
+BENCH_PASSWORD = 'bench-pass-12345'
+# число опросов в бюллетене сценария ballot
+BALLOT_SIZE = 3
+
+
+def generate_dataset(questions, answers, users, votes, skew=1.0, seed=None, chunk_size=5000):
+    """
+    Заполняет БД синтетическими данными: questions активных опросов по answers
+    вариантов ответа, users пользователей с токенами и votes голосов.
+    Опросы выбираются для голосования с весом 1 / rank ** skew, поэтому
+    при skew > 0 голоса сосредоточены на нескольких популярных опросах.
+    Возвращает число созданных голосов
+    """
+    rng = random.Random(seed)
+    current_time = now()
+    # у синтетических пользователей пароль одинаковый, хешируется один раз
+    password = make_password(BENCH_PASSWORD)
+
+    with transaction.atomic():
+        admin, _ = User.objects.get_or_create(
+            username=BENCH_ADMIN, defaults={'is_superuser': True, 'is_staff': True, 'password': password})
+        offset = User.objects.filter(username__startswith=BENCH_PREFIX).count()
+        new_users = [User(username='{}{}'.format(BENCH_PREFIX, offset + i), password=password)
+                     for i in range(users)]
+        User.objects.bulk_create(new_users, batch_size=chunk_size)
+        user_ids = list(User.objects.filter(
+            username__in=[user.username for user in new_users]).values_list('id', flat=True))
+        tokens = [Token(user_id=user_id) for user_id in user_ids]
+        for token in tokens:
+            token.key = token.generate_key()
+        Token.objects.bulk_create(tokens, batch_size=chunk_size)
+
+        new_questions = [Question(title='{}{}'.format(BENCH_PREFIX, i), text='benchmark question',
+                                  owner=admin, date_start=current_time - timedelta(days=1),
+                                  date_end=current_time + timedelta(days=30))
+                         for i in range(questions)]
+        Question.objects.bulk_create(new_questions, batch_size=chunk_size)
+        question_ids = list(Question.objects.filter(
+            title__startswith=BENCH_PREFIX).order_by('-id').values_list('id', flat=True)[:questions])
+        question_ids.reverse()
+        Answer.objects.bulk_create(
+            (Answer(question_id=question_id, answer_text='answer {}'.format(i))
+             for question_id in question_ids for i in range(answers)),
+            batch_size=chunk_size)
+        answer_ids = {}
+        for answer_id, question_id in Answer.objects.filter(
+                question_id__in=question_ids).values_list('id', 'question'):
+            answer_ids.setdefault(question_id, []).append(answer_id)
+
+        weights = [1 / (rank + 1) ** skew for rank in range(len(question_ids))]
+        voted = set()
+        created = 0
+        batch = []
+        # голоса за заполненные опросы отбрасываются, число попыток ограничено
+        for _ in range(votes * 10):
+            if created + len(batch) >= votes or not question_ids or not user_ids:
+                break
+            question_id = rng.choices(question_ids, weights)[0]
+            user_id = rng.choice(user_ids)
+            if (user_id, question_id) in voted:
+                continue
+            voted.add((user_id, question_id))
+            batch.append(Vote(user_id=user_id, question_id=question_id,
+                              answer_id=rng.choice(answer_ids[question_id]),
+                              created=current_time - timedelta(seconds=rng.randint(60, 86400))))
+            if len(batch) >= chunk_size:
+                Vote.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        Vote.objects.bulk_create(batch)
+        created += len(batch)
+
+        # bulk_create не отправляет сигналы: счетчики и кэши обновляются явно
+        rebuild_tallies()
+    cache.clear()
+    return created
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Scenario(object):
+    """
+    Запрос к одному адресу из polls/urls.py: prepare(i) возвращает
+    аргументы метода тестового клиента для i-й итерации. У бесконечных
+    потоков читаются только первые chunks блоков
+    """
+    def __init__(self, name, method, prepare, chunks=None):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.chunks = chunks
+
+    def request(self, client, i):
+        args, kwargs = self.prepare(i)
+        response = getattr(client, self.method)(*args, **kwargs)
+        if response.streaming:
+            for _ in islice(response.streaming_content, self.chunks):
+                pass
+            response.close()
+        return response
+
+
+def build_scenarios(iterations):
+    """
+    Сценарии для всех адресов сервиса на данных generate_dataset
+    """
+    admin = User.objects.filter(username=BENCH_ADMIN).first()
+    if admin is None:
+        return []
+    admin_token, _ = Token.objects.get_or_create(user=admin)
+    auth = {'HTTP_AUTHORIZATION': 'Token ' + admin_token.key}
+    question = Question.objects.filter(
+        title__startswith=BENCH_PREFIX).order_by('id').values_list('id', flat=True).first()
+    answer = Answer.objects.filter(question_id=question).values_list('id', flat=True).first()
+
+    # для голосования нужны пользователи, еще не голосовавшие в опросе
+    voters = list(Token.objects.filter(user__username__startswith=BENCH_PREFIX).exclude(
+        user__vote__question_id=question).values_list('key', flat=True)[:iterations])
+    # бюллетень из первых опросов, голосуют другие пользователи
+    ballot_questions = list(Question.objects.filter(
+        title__startswith=BENCH_PREFIX).order_by('id').values_list('id', flat=True)[:BALLOT_SIZE])
+    ballot = [{'question': question_id, 'answer': answer_id}
+              for question_id, answer_id in sorted(dict(Answer.objects.filter(
+                  question_id__in=ballot_questions).order_by('-id').values_list(
+                  'question_id', 'id')).items())]
+    ballot_voters = list(Token.objects.filter(user__username__startswith=BENCH_PREFIX).exclude(
+        user__vote__question_id__in=ballot_questions).exclude(
+        key__in=voters).values_list('key', flat=True)[:iterations])
+    run = uuid4().hex[:8]
+
+    def vote(i):
+        return (reverse('polls:vote', kwargs={'pk': question}), {'answer': answer}), {
+            'HTTP_AUTHORIZATION': 'Token ' + voters[i % len(voters)]}
+
+    def cast_ballot(i):
+        return (reverse('polls:ballot'), json.dumps(ballot)), {
+            'HTTP_AUTHORIZATION': 'Token ' + ballot_voters[i % len(ballot_voters)],
+            'content_type': 'application/json'}
+
+    return [
+        Scenario('login', 'post', lambda i: (
+            (reverse('polls:login'), {'username': BENCH_ADMIN, 'password': BENCH_PASSWORD}), {})),
+        Scenario('sign-on', 'post', lambda i: (
+            (reverse('polls:sign-on'), {'username': 'bench_signon_{}_{}'.format(run, i),
+                                        'password': BENCH_PASSWORD}), {})),
+        Scenario('bulk_provision', 'post', lambda i: (
+            (reverse('polls:bulk_provision'),
+             json.dumps([{'username': 'bench_bulk_{}_{}'.format(run, i), 'password': BENCH_PASSWORD}])),
+            dict(auth, content_type='application/json'))),
+        Scenario('questions', 'get', lambda i: ((reverse('polls:questions'),), auth)),
+        Scenario('question_details', 'get', lambda i: (
+            (reverse('polls:question_details', kwargs={'pk': question}),), auth)),
+        Scenario('vote', 'post', vote),
+        Scenario('ballot', 'post', cast_ballot),
+        Scenario('vote_status', 'get', lambda i: (
+            (reverse('polls:vote_status', kwargs={'pk': question}),), auth)),
+        Scenario('statistics', 'get', lambda i: ((reverse('polls:statistics'),), auth)),
+        Scenario('timeseries', 'get', lambda i: (
+            (reverse('polls:timeseries', kwargs={'pk': question}),), auth)),
+        # время до первого события: snapshot после retry
+        Scenario('results_stream', 'get', lambda i: (
+            (reverse('polls:results_stream', kwargs={'pk': question}),), auth), chunks=2),
+        Scenario('statistics_export', 'get', lambda i: (
+            (reverse('polls:statistics_export', kwargs={'fmt': 'csv'}),), auth)),
+        Scenario('votes_export', 'get', lambda i: (
+            (reverse('polls:votes_export', kwargs={'fmt': 'ndjson'}),), auth)),
+        Scenario('vote_feed', 'get', lambda i: ((reverse('polls:vote_feed'), {'limit': 100}), auth)),
+        Scenario('metrics', 'get', lambda i: ((reverse('polls:metrics'),), auth)),
+    ] if voters and ballot_voters else []
+
+
+def run_benchmarks(iterations=100, warmup=5, only=None):
+    """
+    Выполняет сценарии через тестовый клиент Django и возвращает по каждому
+    задержки p50/p95/p99 (мс), пропускную способность (запросов в секунду),
+    среднее число и время SQL запросов и коды ответов
+    """
+    client = Client()
+    results = {}
+    scenarios = build_scenarios(iterations + warmup)
+    for scenario in scenarios:
+        if only and scenario.name not in only:
+            continue
+        latencies = []
+        queries = []
+        query_time = []
+        statuses = {}
+        for i in range(warmup + iterations):
+            recorder = QueryRecorder()
+            with record_queries(recorder):
+                start = time.perf_counter()
+                response = scenario.request(client, i)
+                elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            queries.append(recorder.count)
+            query_time.append(recorder.duration)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        total = sum(latencies)
+        results[scenario.name] = {
+            'requests': iterations,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'throughput_rps': iterations / total if total else None,
+            'queries': sum(queries) / iterations,
+            'query_ms': sum(query_time) / iterations * 1000,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        }
+    return {
+        'dataset': {
+            'questions': Question.objects.count(),
+            'answers': Answer.objects.count(),
+            'users': User.objects.count(),
+            'votes': Vote.objects.count(),
+        },
+        'iterations': iterations,
+        'endpoints': results,
+    }
+
+
+def benchmark_serializers(sizes=(1000, 10000), repeat=5):
+    """
+    Сравнивает сериализацию и рендеринг списков опросов и статистики
+    сериализаторами DRF и через RowMapper и FastJSONRenderer на sizes строк.
+    Возвращает лучшее время (мс) обоих способов и ускорение, проверяя
+    совпадение вывода побайтно
+    """
+    current_time = now()
+    datasets = {
+        'questions': (QuestionListSerializer, QuestionList.row_mapper, lambda size: [
+            Question(id=i, title='question {}'.format(i),
+                     pub_date=current_time - timedelta(seconds=i, microseconds=i))
+            for i in range(size)]),
+        'statistics': (StatisticSerializer, StatisticView.row_mapper, lambda size: [
+            {'question': i // 4, 'question__title': 'question {}'.format(i // 4),
+             'answer__answer_text': 'answer {}'.format(i), 'answer': i,
+             'total': 7 + i % 13, 'per_answer': i % 7}
+            for i in range(size)]),
+    }
+    slow_renderer = JSONRenderer()
+    fast_renderer = FastJSONRenderer()
+    results = {}
+    for name, (serializer_class, mapper, build) in sorted(datasets.items()):
+        for size in sizes:
+            rows = build(size)
+            slow = slow_renderer.render(serializer_class(rows, many=True).data)
+            fast = fast_renderer.render(mapper.many(rows))
+            if slow != fast:
+                raise AssertionError('{}: fast path output differs'.format(name))
+            timings = {}
+            for kind, render in (
+                    ('drf', lambda: slow_renderer.render(serializer_class(rows, many=True).data)),
+                    ('fast', lambda: fast_renderer.render(mapper.many(rows)))):
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    render()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[kind] = best * 1000
+            results['{}_{}'.format(name, size)] = {
+                'drf_ms': timings['drf'],
+                'fast_ms': timings['fast'],
+                'speedup': timings['drf'] / timings['fast'] if timings['fast'] else None,
+            }
+    return results
+
+
+def benchmark_caches(operations=10000, value_sizes=(100, 50000)):
+    """
+    Сравнивает кэши locmem, файловый и MmapCache: время операций set и get
+    (мкс на операцию) для значений value_sizes байт и видимость записи,
+    сделанной в другом процессе
+    """
+    directory = tempfile.mkdtemp(prefix='polls_cache_bench_')
+    backends = {
+        'locmem': LocMemCache('bench', {}),
+        'file': FileBasedCache(os.path.join(directory, 'file'), {'OPTIONS': {'MAX_ENTRIES': 1000}}),
+        'mmap': MmapCache(os.path.join(directory, 'cache.mmap'), {}),
+    }
+    results = {}
+    try:
+        for name, backend in sorted(backends.items()):
+            backend.clear()
+            for size in value_sizes:
+                # значение такого же вида, как кэшированные объекты опросов
+                value = [{'id': i, 'title': 'x' * 40} for i in range(max(1, size // 60))]
+                keys = ['key:{}'.format(i) for i in range(min(operations, 500))]
+                timings = {}
+                for operation, call in (('set', lambda key: backend.set(key, value, 300)),
+                                        ('get', backend.get)):
+                    start = time.perf_counter()
+                    for i in range(operations):
+                        call(keys[i % len(keys)])
+                    timings[operation] = (time.perf_counter() - start) / operations * 1e6
+                results['{}_{}'.format(name, size)] = {
+                    'set_us': timings['set'], 'get_us': timings['get']}
+            backend.set('shared', None)
+            child = multiprocessing.Process(target=backend.set, args=('shared', True))
+            child.start()
+            child.join()
+            results[name + '_shared'] = backend.get('shared') is True
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(baseline, current):
+    """
+    Сравнивает два результата run_benchmarks, возвращает строки отчета
+    с изменением p50, p95 и числа запросов в процентах
+    """
+    lines = []
+    for name, result in sorted(current['endpoints'].items()):
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            lines.append('{:<20} new'.format(name))
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'queries'):
+            if base[key]:
+                changes.append('{} {:+.1f}%'.format(key, (result[key] - base[key]) / base[key] * 100))
+            else:
+                changes.append('{} {} -> {}'.format(key, base[key], result[key]))
+        lines.append('{:<20} {}'.format(name, ', '.join(changes)))
+    return lines
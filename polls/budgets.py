@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import re
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+# максимальное число SQL запросов на один запрос к адресу из polls/urls.py
+# при пустых кэшах, включая проверку токена. Не зависит от числа строк в БД
+QUERY_BUDGETS = {
+    'login': 2,
+    'sign-on': 3,
+    # проверка имен, вставка пользователей и токенов одной порцией
+    'bulk_provision': 5,
+    # опросы и варианты ответов, ближайшая граница активности для кэша
+    'questions': 5,
+    'question_details': 5,
+    # проверка ответа и повторного голоса, вставка голоса и два счетчика
+    'vote': 5,
+    # проверка всех пар одним запросом, одна вставка и по два счетчика
+    # на каждый из BALLOT_SIZE опросов сценария
+    'ballot': 9,
+    'vote_status': 2,
+    # версия для ETag, страница счетчиков и страница итогов архивированных опросов
+    'statistics': 4,
+    'timeseries': 3,
+    # проверка опроса и счетчики для первого события, дальше общие для подписчиков
+    'results_stream': 3,
+    # открытые и архивированные опросы читаются параллельно
+    'statistics_export': 3,
+    'votes_export': 3,
+    # открытые и архивированные голоса после курсора
+    'vote_feed': 3,
+    'metrics': 1,
+}
+
+# точки сохранения зависят от вложенности транзакций, а не от запроса
+SAVEPOINT_RE = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.I)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Запрос к адресу выполнил больше SQL запросов, чем разрешено бюджетом
+    """
+
+
+@contextmanager
+def query_budget(name, budget=None, using='default'):
+    """
+    Проверяет, что код внутри блока выполнил не больше budget SQL запросов
+    (по умолчанию QUERY_BUDGETS[name]), иначе выбрасывает QueryBudgetExceeded
+    со списком выполненных запросов
+    """
+    if budget is None:
+        budget = QUERY_BUDGETS[name]
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    queries = [query['sql'] for query in context.captured_queries
+               if not SAVEPOINT_RE.match(query['sql'])]
+    if len(queries) > budget:
+        raise QueryBudgetExceeded('{}: {} queries executed, budget is {}\n{}'.format(
+            name, len(queries), budget,
+            '\n'.join('{}. {}'.format(number, sql) for number, sql in enumerate(queries, 1))))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min
+
+from .models import Question
+from .routers import INVALIDATED, invalidate_cache, primary_reads
+
+ACTIVE_QUESTIONS_KEY = 'polls:active_questions'
+
+# время жизни кэша, если ближайших начала и конца опросов нет
+MAX_AGE = timedelta(days=1)
+
+
+def get_active_questions(current_time):
+    """
+    Возвращает кэшированный набор активных на current_time опросов:
+    словарь с ключами questions (список опросов с вариантами ответа),
+    index (опросы по id), version и modified (версия и время изменения набора).
+    Набор действителен до ближайшего начала или окончания какого-либо опроса.
+    После сброса набор строится по основной БД
+    """
+    entry = cache.get(ACTIVE_QUESTIONS_KEY)
+    invalidated = entry == INVALIDATED
+    if invalidated or entry is None or not (
+            entry['valid_from'] <= current_time < entry['valid_until']):
+        with primary_reads(invalidated):
+            entry = _build_active_questions(current_time)
+        timeout = (entry['valid_until'] - current_time).total_seconds()
+        cache.set(ACTIVE_QUESTIONS_KEY, entry, max(1, timeout))
+    return entry
+
+
+def _build_active_questions(current_time):
+    questions = list(
+        Question.objects.filter(date_start__lt=current_time, date_end__gt=current_time)
+        .prefetch_related('answer_set')
+        .order_by('pub_date', 'id')
+    )
+    # набор изменится при ближайшем окончании активного опроса
+    # или при начале одного из будущих
+    boundaries = [question.date_end for question in questions]
+    next_start = Question.objects.filter(
+        date_start__gte=current_time).aggregate(next_start=Min('date_start'))['next_start']
+    if next_start is not None:
+        boundaries.append(next_start)
+    valid_until = min(boundaries + [current_time + MAX_AGE])
+    # версия набора для ETag: изменение вариантов ответа обновляет время изменения опроса
+    version = md5(' '.join(
+        '{}:{}'.format(question.id, question.modified.timestamp()) for question in questions
+    ).encode()).hexdigest()
+    return {
+        'questions': questions,
+        'index': {question.id: question for question in questions},
+        'version': version,
+        'modified': max((question.modified for question in questions), default=None),
+        'valid_from': current_time,
+        'valid_until': valid_until,
+    }
+
+
+def invalidate_active_questions():
+    """
+    Сбрасывает кэш активных опросов сразу и повторно после фиксации транзакции,
+    чтобы не остался набор, построенный по еще не зафиксированным данным
+    """
+    invalidate_cache([ACTIVE_QUESTIONS_KEY])
+    transaction.on_commit(lambda: invalidate_cache([ACTIVE_QUESTIONS_KEY]))
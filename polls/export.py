@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import csv
+import heapq
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import router, transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import AnswerSnapshot, ArchivedVote, Vote, VoteTally
+
+# число строк, получаемых из серверного курсора за одно обращение
+EXPORT_CHUNK_SIZE = getattr(settings, 'POLLS_EXPORT_CHUNK_SIZE', 2000)
+
+# примерный размер блока выгрузки в символах
+BLOCK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def statistic_rows(chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Строки статистики в том же составе, что и у StatisticSerializer,
+    счетчики открытых опросов и итоги архивированных в порядке опросов
+    """
+    fields = ('question', 'question__title', 'answer__answer_text', 'answer')
+    live = VoteTally.objects.using(using).filter(count__gt=0).values_list(
+        *fields, 'question__tally__total', 'count'
+    ).order_by('question', 'answer').iterator(chunk_size=chunk_size)
+    archived = AnswerSnapshot.objects.using(using).filter(count__gt=0).values_list(
+        *fields, 'question__snapshot__total', 'count'
+    ).order_by('question', 'answer').iterator(chunk_size=chunk_size)
+    rows = heapq.merge(live, archived, key=lambda row: (row[0], row[3]))
+    for question, title, answer_text, answer, total, count in rows:
+        frequency = round(Decimal(count / total), 2)
+        yield question, title, answer_text, total, answer, frequency
+
+
+def vote_rows(chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Исходные голоса пользователей, включая перенесенные в архив
+    """
+    fields = ('id', 'user', 'question', 'answer', 'created')
+    return heapq.merge(
+        Vote.objects.using(using).values_list(*fields).order_by('id')
+        .iterator(chunk_size=chunk_size),
+        ArchivedVote.objects.using(using).values_list(*fields).order_by('id')
+        .iterator(chunk_size=chunk_size),
+        key=lambda row: row[0])
+
+
+DATASETS = {
+    'statistics': (('question', 'question__title', 'answer__answer_text',
+                    'total', 'answer', 'frequency'), statistic_rows),
+    'votes': (('id', 'user', 'question', 'answer', 'created'), vote_rows),
+}
+
+
+class _Echo(object):
+    """
+    Псевдо-файл для csv.writer, возвращающий записанную строку
+    """
+    def write(self, value):
+        return value
+
+
+def render_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(header, rows):
+    """
+    Строки NDJSON: кортежи rows с полями header или готовые словари, если header - None
+    """
+    for row in rows:
+        if header is not None:
+            row = dict(zip(header, row))
+        yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'ndjson': render_ndjson,
+}
+
+
+def export(dataset, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Возвращает генератор выгрузки dataset в формате fmt. Строки читаются из БД
+    порциями по chunk_size через серверный курсор и отдаются блоками,
+    чтобы не писать в сокет каждую строку отдельно.
+    Выгрузка читает одну БД в транзакции, открытой до конца выгрузки:
+    вне транзакции курсоры PostgreSQL создаются WITH HOLD, и сервер
+    сохраняет весь результат до выдачи первой строки
+    """
+    header, rows = DATASETS[dataset]
+    using = router.db_for_read(Vote)
+    with transaction.atomic(using=using):
+        block = []
+        size = 0
+        for line in RENDERERS[fmt](header, rows(chunk_size, using)):
+            block.append(line)
+            size += len(line)
+            if size >= BLOCK_SIZE:
+                yield ''.join(block)
+                block = []
+                size = 0
+        if block:
+            yield ''.join(block)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import heapq
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import DateTimeField, Value
+from django.utils.timezone import now
+
+from .models import ArchivedVote, Vote
+
+FEED_FIELDS = ('id', 'question', 'answer', 'user', 'created')
+
+# голоса, записанные позже этого интервала назад, не отдаются: транзакция
+# с меньшим id могла еще не зафиксироваться, и потребитель, сдвинувший курсор,
+# пропустил бы ее голос. Интервал должен превышать длительность транзакций записи
+FEED_GRACE = timedelta(seconds=getattr(settings, 'POLLS_FEED_GRACE', 5))
+
+FEED_BATCH_SIZE = getattr(settings, 'POLLS_FEED_BATCH_SIZE', 1000)
+
+
+def read_feed(since, limit=FEED_BATCH_SIZE, grace=FEED_GRACE):
+    """
+    Голоса с id больше since в порядке id, не больше limit: кортежи полей
+    FEED_FIELDS. Голоса архивированных опросов сохраняют свои id и читаются
+    из ArchivedVote. Выдача обрывается на первом голосе, записанном позже,
+    чем grace назад
+    """
+    cutoff = now() - grace
+    votes = heapq.merge(
+        Vote.objects.filter(id__gt=since)
+        .values_list(*FEED_FIELDS + ('recorded',)).order_by('id')[:limit],
+        # архивируются голоса закрытых опросов, давно зафиксированные
+        ArchivedVote.objects.filter(id__gt=since)
+        .annotate(recorded=Value(None, output_field=DateTimeField()))
+        .values_list(*FEED_FIELDS + ('recorded',)).order_by('id')[:limit],
+        key=lambda row: row[0])
+    batch = []
+    for vote in islice(votes, limit):
+        recorded = vote[-1]
+        if recorded is not None and recorded >= cutoff:
+            break
+        batch.append(vote[:-1])
+    return batch
+
+
+def wait_feed(since, limit=FEED_BATCH_SIZE, timeout=0, grace=FEED_GRACE):
+    """
+    read_feed с ожиданием: если новых голосов нет, повторяет чтение
+    раз в POLLS_FEED_POLL_INTERVAL секунд, пока голоса не появятся
+    или не пройдет timeout секунд
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = read_feed(since, limit, grace)
+        remaining = deadline - time.monotonic()
+        if batch or remaining <= 0:
+            return batch
+        time.sleep(min(getattr(settings, 'POLLS_FEED_POLL_INTERVAL', 1.0), remaining))
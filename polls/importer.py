@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+
+from .ingestion import create_votes
+from .models import Answer, Vote
+
+IMPORT_CHUNK_SIZE = 5000
+
+
+class RecordError(ValueError):
+    """
+    Строка выгрузки не может быть импортирована
+    """
+
+
+def read_chunks(path, fmt, offset=0, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Читает файл голосов начиная с байтового смещения offset, возвращает порции
+    [(смещение строки, строка, разобранная запись), ...] и смещение после порции.
+    Каждая запись должна занимать одну строку
+    """
+    with open(path, 'rb') as source:
+        header = None
+        if fmt == 'csv':
+            first = source.readline()
+            header = next(csv.reader([first.decode('utf-8')]))
+            offset = max(offset, len(first))
+        source.seek(offset)
+        chunk = []
+        for line in source:
+            if line.strip():
+                chunk.append((offset, line, parse_line(line, fmt, header)))
+            offset += len(line)
+            if len(chunk) >= chunk_size:
+                yield chunk, offset
+                chunk = []
+        if chunk:
+            yield chunk, offset
+
+
+def parse_line(line, fmt, header):
+    """
+    Разбирает строку в словарь полей или возвращает исключение RecordError
+    """
+    try:
+        text = line.decode('utf-8').strip()
+        if fmt == 'csv':
+            values = next(csv.reader([text]))
+            if len(values) != len(header):
+                raise ValueError('wrong number of columns')
+            row = dict(zip(header, values))
+        else:
+            row = json.loads(text)
+            if not isinstance(row, dict):
+                raise ValueError('record is not an object')
+
+        created = row.get('created') or None
+        if created is not None:
+            created = parse_datetime(created)
+            if created is None:
+                raise ValueError('invalid created')
+            if is_naive(created):
+                created = make_aware(created)
+        user = row.get('user') or None
+        return {
+            'user': int(user) if user is not None else None,
+            'username': row.get('username') or None,
+            'question': int(row['question']),
+            'answer': int(row['answer']),
+            'created': created,
+        }
+    except (ValueError, TypeError, KeyError, UnicodeError) as error:
+        return RecordError(str(error) or 'invalid record')
+
+
+def import_chunk(rows):
+    """
+    Проверяет порцию строк набором запросов на всю порцию и записывает
+    подходящие голоса одним bulk_create в одной транзакции.
+    rows: [(смещение, строка, словарь полей или RecordError)].
+    Возвращает пару (число записанных голосов, [(смещение, строка, причина отказа)])
+    """
+    lines = {offset: line for offset, line, _ in rows}
+    rejects = [(offset, str(row)) for offset, _, row in rows if isinstance(row, RecordError)]
+    rows = [(offset, row) for offset, _, row in rows if not isinstance(row, RecordError)]
+
+    usernames = {row['username'] for _, row in rows if row['user'] is None and row['username']}
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    known_ids = set(User.objects.filter(
+        id__in={row['user'] for _, row in rows if row['user'] is not None}
+    ).values_list('id', flat=True))
+    answers = {
+        answer_id: (question_id, date_start, date_end, archived)
+        for answer_id, question_id, date_start, date_end, archived in Answer.objects.filter(
+            id__in={row['answer'] for _, row in rows}
+        ).values_list('id', 'question', 'question__date_start', 'question__date_end',
+                      'question__snapshot')
+    }
+
+    current_time = now()
+    candidates = []
+    for offset, row in rows:
+        user_id = row['user'] if row['user'] in known_ids else user_ids.get(row['username'])
+        answer = answers.get(row['answer'])
+        created = row['created'] or current_time
+        if user_id is None:
+            rejects.append((offset, 'unknown user'))
+        elif answer is None or answer[0] != row['question']:
+            rejects.append((offset, 'Answer is not valid'))
+        elif not answer[1] <= created <= answer[2] or answer[3] is not None:
+            # итоги архивированного опроса уже зафиксированы
+            rejects.append((offset, 'Question is not active'))
+        else:
+            candidates.append((offset, Vote(user_id=user_id, question_id=row['question'],
+                                            answer_id=row['answer'], created=created)))
+
+    with transaction.atomic():
+        existing = set(Vote.objects.filter(
+            user_id__in={vote.user_id for _, vote in candidates},
+            question_id__in={vote.question_id for _, vote in candidates}
+        ).values_list('user_id', 'question_id'))
+        votes = []
+        for offset, vote in candidates:
+            key = (vote.user_id, vote.question_id)
+            if key in existing:
+                rejects.append((offset, 'Already voted'))
+            else:
+                # повторы внутри самой порции
+                existing.add(key)
+                votes.append((offset, vote))
+        created, duplicates = create_votes([vote for _, vote in votes])
+
+    duplicates = {id(vote) for vote in duplicates}
+    rejects.extend((offset, 'Already voted') for offset, vote in votes if id(vote) in duplicates)
+    return len(created), [(offset, lines[offset], reason) for offset, reason in sorted(rejects)]
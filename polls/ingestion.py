@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+
+from .models import Answer, ArchivedVote, PendingVote, Vote
+from .tallies import record_votes
+
+DIRECT = 'direct'
+BUFFERED = 'buffered'
+
+DRAIN_BATCH_SIZE = getattr(settings, 'POLLS_DRAIN_BATCH_SIZE', 1000)
+
+BALLOT_MAX_SIZE = getattr(settings, 'POLLS_BALLOT_MAX_SIZE', 100)
+
+
+def is_buffered():
+    """
+    Включен ли режим отложенной записи голосов через очередь PendingVote
+    """
+    return getattr(settings, 'POLLS_VOTE_INGESTION', DIRECT) == BUFFERED
+
+
+def drain_votes(batch_size=DRAIN_BATCH_SIZE):
+    """
+    Переносит голоса из очереди в Vote порциями по batch_size, каждая порция
+    записывается одним bulk_create в одной транзакции вместе со счетчиками.
+    Возвращает пару (записано, отклонено)
+    """
+    recorded = rejected = 0
+    while True:
+        batch_recorded, batch_rejected = _drain_batch(batch_size)
+        recorded += batch_recorded
+        rejected += batch_rejected
+        if batch_recorded + batch_rejected < batch_size:
+            return recorded, rejected
+
+
+def _drain_batch(batch_size):
+    with transaction.atomic():
+        # несколько обработчиков очереди не мешают друг другу
+        pending = list(PendingVote.objects.select_for_update(skip_locked=True).filter(
+            state=PendingVote.PENDING).order_by('id')[:batch_size])
+        if not pending:
+            return 0, 0
+
+        # голоса, записанные помимо очереди, проверяются одним запросом на порцию
+        existing = set(Vote.objects.filter(
+            user_id__in={vote.user_id for vote in pending},
+            question_id__in={vote.question_id for vote in pending}
+        ).values_list('user_id', 'question_id'))
+        accepted = [vote for vote in pending if (vote.user_id, vote.question_id) not in existing]
+        duplicates = [vote.pk for vote in pending if (vote.user_id, vote.question_id) in existing]
+
+        created, _ = create_votes(_to_votes(accepted))
+        recorded = {(vote.user_id, vote.question_id) for vote in created}
+        PendingVote.objects.filter(pk__in=[
+            vote.pk for vote in accepted if (vote.user_id, vote.question_id) in recorded
+        ]).delete()
+        # голоса, записанные параллельно уже после проверки
+        duplicates.extend(vote.pk for vote in accepted
+                          if (vote.user_id, vote.question_id) not in recorded)
+        PendingVote.objects.filter(pk__in=duplicates).update(state=PendingVote.REJECTED)
+    return len(created), len(duplicates)
+
+
+def _to_votes(pending):
+    return [Vote(user_id=vote.user_id, question_id=vote.question_id,
+                 answer_id=vote.answer_id, created=vote.created) for vote in pending]
+
+
+def create_votes(votes):
+    """
+    Записывает голоса одним bulk_create и увеличивает счетчики, вызывается
+    внутри транзакции. Если часть голосов уже записана параллельно, голоса
+    записываются по одному. Возвращает пару (записанные, повторные голоса)
+    """
+    created, duplicates = insert_votes(Vote, votes)
+    record_votes([(vote.question_id, vote.answer_id) for vote in created])
+    return created, duplicates
+
+
+def insert_votes(model, votes):
+    """
+    Вставляет голоса Vote или PendingVote одним bulk_create, при нарушении
+    уникальности (user, question) - по одному.
+    Возвращает пару (записанные, повторные голоса)
+    """
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(votes)
+        return votes, []
+    except IntegrityError:
+        created, duplicates = [], []
+        for vote in votes:
+            try:
+                with transaction.atomic():
+                    vote.pk = None
+                    vote.save()
+                created.append(vote)
+            except IntegrityError:
+                duplicates.append(vote)
+        return created, duplicates
+
+
+def cast_ballot(user, items):
+    """
+    Голосование пользователя сразу в нескольких опросах, вызывается внутри
+    транзакции. items: [{'question': id, 'answer': id}]. Все пары проверяются
+    одним запросом, подходящие голоса записываются одним bulk_create (в режиме
+    отложенной записи - ставятся в очередь). Возвращает пару (результаты по
+    каждой паре в порядке items, записанные голоса)
+    """
+    answers = {
+        answer_id: (question_id, date_start, date_end, voted)
+        for answer_id, question_id, date_start, date_end, voted in Answer.objects.filter(
+            id__in={item['answer'] for item in items}
+        ).annotate(
+            voted=Exists(Vote.objects.filter(user=user, question_id=OuterRef('question_id')))
+        ).values_list('id', 'question_id', 'question__date_start', 'question__date_end', 'voted')
+    }
+
+    model = PendingVote if is_buffered() else Vote
+    current_time = now()
+    results, votes, questions = [], [], set()
+    for item in items:
+        answer = answers.get(item['answer'])
+        result = {'question': item['question'], 'answer': item['answer']}
+        if answer is None or answer[0] != item['question']:
+            result['error'] = 'Answer is not valid'
+        elif not answer[1] <= current_time <= answer[2]:
+            result['error'] = 'Question is not active'
+        elif answer[3] or item['question'] in questions:
+            result['error'] = 'Already voted'
+        else:
+            questions.add(item['question'])
+            votes.append((result, model(user=user, question_id=item['question'],
+                                        answer_id=item['answer'])))
+        results.append(result)
+
+    if model is Vote:
+        created, _ = create_votes([vote for _, vote in votes])
+    else:
+        created, _ = insert_votes(model, [vote for _, vote in votes])
+    created_ids = {id(vote) for vote in created}
+    for result, vote in votes:
+        if id(vote) not in created_ids:
+            # голос записан параллельным запросом после проверки
+            result['error'] = 'Already voted'
+    for result in results:
+        error = result.pop('error', None)
+        if error is None:
+            result['status'] = 'pending' if model is PendingVote else 'recorded'
+        else:
+            result.update(status='rejected', error=error)
+    return results, created
+
+
+def vote_status(user, question_id):
+    """
+    Состояние голоса пользователя в опросе: recorded, pending, rejected или none.
+    Голоса закрытых опросов ищутся и в архиве: голос переносится после проверки Vote
+    """
+    if Vote.objects.filter(user=user, question_id=question_id).exists():
+        return 'recorded'
+    if ArchivedVote.objects.filter(user=user, question_id=question_id).exists():
+        return 'recorded'
+    state = PendingVote.objects.filter(
+        user=user, question_id=question_id).values_list('state', flat=True).first()
+    return state or 'none'
+
+
+def active_votes(user, current_time):
+    """
+    Голоса пользователя в активных на current_time опросах, записанные
+    и ожидающие записи, одним запросом: {question_id: (answer_id, время голоса)}
+    """
+    recorded = Vote.objects.filter(
+        user=user, question__date_start__lt=current_time, question__date_end__gt=current_time
+    ).values_list('question_id', 'answer_id', 'created')
+    pending = PendingVote.objects.filter(
+        user=user, state=PendingVote.PENDING,
+        question__date_start__lt=current_time, question__date_end__gt=current_time
+    ).values_list('question_id', 'answer_id', 'created')
+    return {question_id: (answer_id, created)
+            for question_id, answer_id, created in recorded.union(pending, all=True)}
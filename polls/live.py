@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.middleware import gzip
+
+from .models import AnswerSnapshot, VoteTally
+
+
+def live_setting(name, default):
+    return getattr(settings, 'POLLS_LIVE_' + name, default)
+
+
+class Channel(object):
+    """
+    Счетчики голосов одного опроса, общие для всех подписчиков процесса.
+    Голоса этого процесса добавляются через publish, голоса других воркеров
+    подтягиваются из счетчиков в БД не чаще раза в POLLS_LIVE_POLL_INTERVAL
+    """
+    def __init__(self, question_id):
+        self.question_id = question_id
+        self.subscribers = 0
+        self.version = 0
+        self.counts = None
+        self.refreshed = 0.0
+        self.condition = threading.Condition()
+
+    def refresh(self, force=False):
+        with self.condition:
+            if not force and time.monotonic() - self.refreshed < live_setting('POLL_INTERVAL', 1.0):
+                return
+            self.refreshed = time.monotonic()
+        counts = dict(VoteTally.objects.filter(
+            question_id=self.question_id).values_list('answer', 'count'))
+        if not counts:
+            # архивированный опрос
+            counts = dict(AnswerSnapshot.objects.filter(
+                question_id=self.question_id).values_list('answer', 'count'))
+        with self.condition:
+            merged = dict(self.counts or {})
+            for answer_id, count in counts.items():
+                # голос, опубликованный после чтения из БД, не теряется
+                merged[answer_id] = max(merged.get(answer_id, 0), count)
+            if merged != self.counts:
+                self.counts = merged
+                self.version += 1
+                self.condition.notify_all()
+
+    def apply(self, deltas):
+        with self.condition:
+            if self.counts is None:
+                return
+            for answer_id, delta in deltas.items():
+                self.counts[answer_id] = self.counts.get(answer_id, 0) + delta
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        """
+        Ждет изменения счетчиков после version не дольше timeout секунд
+        """
+        with self.condition:
+            if self.version == version:
+                self.condition.wait(timeout)
+
+    def state(self):
+        """
+        Возвращает пару (копия счетчиков, версия)
+        """
+        with self.condition:
+            return dict(self.counts or {}), self.version
+
+
+class Broker(object):
+    """
+    Публикация изменений счетчиков подписчикам внутри процесса
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, question_id):
+        with self._lock:
+            channel = self._channels.get(question_id)
+            if channel is None:
+                channel = self._channels[question_id] = Channel(question_id)
+            channel.subscribers += 1
+        if channel.counts is None:
+            channel.refresh(force=True)
+        return channel
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            channel.subscribers -= 1
+            if not channel.subscribers:
+                self._channels.pop(channel.question_id, None)
+
+    def publish(self, question_id, deltas):
+        """
+        Добавляет к счетчикам опроса deltas {answer_id: число голосов}.
+        Вызывается после фиксации транзакции с голосами
+        """
+        with self._lock:
+            channel = self._channels.get(question_id)
+        if channel is not None:
+            channel.apply(deltas)
+
+
+broker = Broker()
+
+
+def publish_votes(votes):
+    """
+    Публикует записанные голоса подписчикам их опросов
+    """
+    deltas = {}
+    for vote in votes:
+        counts = deltas.setdefault(vote.question_id, {})
+        counts[vote.answer_id] = counts.get(vote.answer_id, 0) + 1
+    for question_id, counts in deltas.items():
+        broker.publish(question_id, counts)
+
+
+def event(name, data):
+    return 'event: {}\ndata: {}\n\n'.format(name, json.dumps(data, separators=(',', ':')))
+
+
+def release_connections():
+    """
+    Закрывает соединения с БД потока вне транзакции: подписчик обращается к БД
+    раз в POLLS_LIVE_POLL_INTERVAL, и тысячи подписчиков асинхронного воркера
+    не должны держать тысячи соединений
+    """
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def stream_results(question_id):
+    """
+    Поток Server-Sent Events: сначала событие snapshot со всеми счетчиками
+    опроса, затем события tally с изменениями счетчиков не чаще
+    POLLS_LIVE_RATE раз в секунду. Через POLLS_LIVE_MAX_SECONDS поток
+    закрывается, и клиент переподключается
+    """
+    channel = broker.subscribe(question_id)
+    try:
+        interval = 1.0 / live_setting('RATE', 2)
+        poll_interval = live_setting('POLL_INTERVAL', 1.0)
+        heartbeat = live_setting('HEARTBEAT', 15)
+        # поток короче таймаута воркера gunicorn (30 секунд)
+        deadline = time.monotonic() + live_setting('MAX_SECONDS', 25)
+
+        sent, version = channel.state()
+        release_connections()
+        yield 'retry: {}\n\n'.format(int(poll_interval * 1000))
+        yield event('snapshot', {'question': question_id, 'counts': sent,
+                                 'total': sum(sent.values())})
+        last_event = time.monotonic()
+        while time.monotonic() < deadline:
+            channel.wait(version, poll_interval)
+            channel.refresh()
+            release_connections()
+            counts, version = channel.state()
+            deltas = {answer_id: count - sent.get(answer_id, 0)
+                      for answer_id, count in counts.items() if count != sent.get(answer_id, 0)}
+            if deltas:
+                sent = counts
+                yield event('tally', {'question': question_id, 'deltas': deltas,
+                                      'total': sum(counts.values())})
+                last_event = time.monotonic()
+                # изменения, пришедшие за паузу, уйдут одним событием
+                time.sleep(max(0.0, min(interval, deadline - last_event)))
+            elif time.monotonic() - last_event >= heartbeat:
+                yield ': keepalive\n\n'
+                last_event = time.monotonic()
+    finally:
+        broker.unsubscribe(channel)
+
+
+class GZipMiddleware(gzip.GZipMiddleware):
+    """
+    GZipMiddleware, не сжимающая потоки Server-Sent Events:
+    сжатие копит события в буфере, и клиент получает их с задержкой
+    """
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        return super(GZipMiddleware, self).process_response(request, response)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from polls.archive import ARCHIVE_BATCH_SIZE, ARCHIVE_GRACE, archive_polls
+
+
+class Command(BaseCommand):
+    help = ('Фиксирует итоги закрытых опросов и переносит их голоса из Vote '
+            'в архивную таблицу')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help='число голосов, переносимых в одной транзакции')
+        parser.add_argument('--grace', type=float, default=ARCHIVE_GRACE.total_seconds(),
+                            help='архивировать опросы, закрытые больше этого числа секунд назад')
+
+    def handle(self, *args, **options):
+        questions, moved = archive_polls(options['batch_size'], timedelta(seconds=options['grace']))
+        self.stdout.write(self.style.SUCCESS(
+            'Архивировано опросов: {}, перенесено голосов: {}'.format(questions, moved)))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from polls.rollups import ROLLUP_BATCH_SIZE, ROLLUP_GRACE, compact_rollups
+
+
+class Command(BaseCommand):
+    help = 'Добавляет новые голоса в поминутные и почасовые сводки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE,
+                            help='число голосов, обрабатываемых в одной транзакции')
+        parser.add_argument('--grace', type=float, default=ROLLUP_GRACE.total_seconds(),
+                            help='не обрабатывать голоса моложе этого числа секунд')
+
+    def handle(self, *args, **options):
+        processed = compact_rollups(options['batch_size'], timedelta(seconds=options['grace']))
+        self.stdout.write(self.style.SUCCESS('Обработано голосов: {}'.format(processed)))
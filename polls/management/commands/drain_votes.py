@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.ingestion import DRAIN_BATCH_SIZE, drain_votes
+
+
+class Command(BaseCommand):
+    help = 'Записывает голоса из очереди отложенной записи в Vote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DRAIN_BATCH_SIZE,
+                            help='число голосов, записываемых в одной транзакции')
+        parser.add_argument('--loop', action='store_true',
+                            help='обрабатывать очередь непрерывно')
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='пауза в секундах, если очередь пуста')
+
+    def handle(self, *args, **options):
+        while True:
+            recorded, rejected = drain_votes(options['batch_size'])
+            if recorded or rejected or not options['loop']:
+                self.stdout.write('Записано голосов: {}, отклонено: {}'.format(recorded, rejected))
+            if not options['loop']:
+                return
+            if not recorded and not rejected:
+                time.sleep(options['interval'])
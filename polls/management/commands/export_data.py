@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from polls.export import DATASETS, EXPORT_CHUNK_SIZE, RENDERERS, export
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка статистики или голосов в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(RENDERERS), default='csv')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='число строк, читаемых из БД за одно обращение')
+        parser.add_argument('--output', help='файл выгрузки, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        lines = export(options['dataset'], options['fmt'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.benchmarks import generate_dataset
+
+
+class Command(BaseCommand):
+    help = ('Заполняет БД синтетическими опросами, пользователями и голосами '
+            'для нагрузочных замеров. Запускать только на отдельной БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--answers', type=int, default=4, help='вариантов ответа в опросе')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--votes', type=int, default=10000)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='вес опроса 1 / rank ** skew, 0 - равномерно')
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        if min(options['questions'], options['answers'], options['users'], options['votes']) < 0:
+            raise CommandError('Counts must not be negative')
+        if options['questions'] and not options['answers']:
+            raise CommandError('Questions need at least one answer')
+        created = generate_dataset(options['questions'], options['answers'], options['users'],
+                                   options['votes'], options['skew'], options['seed'])
+        self.stdout.write(self.style.SUCCESS('Создано голосов: {}'.format(created)))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.importer import IMPORT_CHUNK_SIZE, import_chunk, read_chunks
+
+
+class Command(BaseCommand):
+    help = ('Импортирует голоса из NDJSON или CSV файла (одна запись в строке, поля '
+            'user или username, question, answer, created). Прерванный импорт '
+            'продолжается с выведенного смещения параметром --offset')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=('csv', 'ndjson'),
+                            help='по умолчанию определяется по расширению файла')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='байтовое смещение, с которого продолжить импорт')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help='число строк, проверяемых и записываемых за раз')
+        parser.add_argument('--rejects', help='файл отклоненных строк, по умолчанию <path>.rejects')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['fmt'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        rejects_path = options['rejects'] or path + '.rejects'
+
+        imported = rejected = 0
+        try:
+            with open(rejects_path, 'a', encoding='utf-8') as rejects:
+                for rows, offset in read_chunks(path, fmt, options['offset'], options['chunk_size']):
+                    count, chunk_rejects = import_chunk(rows)
+                    for line_offset, line, reason in chunk_rejects:
+                        rejects.write(json.dumps({
+                            'offset': line_offset,
+                            'line': line.decode('utf-8', 'replace').rstrip('\r\n'),
+                            'reason': reason,
+                        }, ensure_ascii=False) + '\n')
+                    rejects.flush()
+                    imported += count
+                    rejected += len(chunk_rejects)
+                    self.stdout.write('offset={} imported={} rejected={}'.format(
+                        offset, imported, rejected))
+        except OSError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Импортировано голосов: {}, отклонено: {}'.format(imported, rejected)))
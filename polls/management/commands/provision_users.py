@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import render_ndjson
+from polls.provisioning import (PROVISION_CHUNK_SIZE,
+                                PROVISION_PROCESSES,
+                                provision_users)
+
+
+class Command(BaseCommand):
+    help = ('Массово создает пользователей и токены из CSV (username,password) '
+            'или NDJSON файла и выводит выданные токены в NDJSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=('csv', 'ndjson'),
+                            help='по умолчанию определяется по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=PROVISION_CHUNK_SIZE)
+        parser.add_argument('--processes', type=int, default=PROVISION_PROCESSES,
+                            help='число процессов для хеширования паролей')
+        parser.add_argument('--output', help='файл для токенов, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['fmt'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        try:
+            with open(path, encoding='utf-8', newline='') as source:
+                lines = provision_users(self.read(source, fmt),
+                                        options['chunk_size'], options['processes'])
+                if options['output']:
+                    with open(options['output'], 'w', encoding='utf-8') as output:
+                        output.writelines(render_ndjson(None, lines))
+                else:
+                    for line in render_ndjson(None, lines):
+                        self.stdout.write(line, ending='')
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(error)
+
+    def read(self, source, fmt):
+        if fmt == 'csv':
+            for row in csv.DictReader(source):
+                yield row['username'], row['password']
+        else:
+            for line in source:
+                if line.strip():
+                    row = json.loads(line)
+                    yield row['username'], row['password']
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.tallies import rebuild_tallies, verify_tallies
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики голосов по таблице Vote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='только проверить счетчики, не исправляя их')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatches = verify_tallies()
+            for kind, pk, stored, actual in mismatches:
+                self.stdout.write('{} {}: stored={} actual={}'.format(kind, pk, stored, actual))
+            if mismatches:
+                raise CommandError('Найдено расхождений: {}'.format(len(mismatches)))
+            self.stdout.write(self.style.SUCCESS('Счетчики совпадают с голосами'))
+            return
+
+        fixed = rebuild_tallies()
+        self.stdout.write(self.style.SUCCESS('Исправлено счетчиков: {}'.format(fixed)))
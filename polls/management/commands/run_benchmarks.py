@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from polls.benchmarks import benchmark_caches, benchmark_serializers, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержки, пропускную способность и SQL запросы всех адресов '
+            'сервиса на данных generate_load_data. Запросы изменяют БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoint', action='append', dest='only',
+                            help='имя адреса из polls/urls.py, можно указать несколько раз')
+        parser.add_argument('--output', help='файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+        parser.add_argument('--serializers', action='store_true',
+                            help='сравнить сериализаторы DRF и быстрый путь вместо запросов')
+        parser.add_argument('--rows', type=int, action='append',
+                            help='число строк для --serializers, можно указать несколько раз')
+        parser.add_argument('--caches', action='store_true',
+                            help='сравнить кэши locmem, файловый и mmap вместо запросов')
+        parser.add_argument('--i-know-this-writes', action='store_true',
+                            help='подтвердить, что БД default - отдельная БД для замеров')
+
+    def handle(self, *args, **options):
+        if options['caches']:
+            results = benchmark_caches()
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        if options['serializers']:
+            results = benchmark_serializers(options['rows'] or (1000, 10000))
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        if not options['i_know_this_writes']:
+            raise CommandError('Benchmarks write to database "{}", pass --i-know-this-writes '
+                               'to run them on a scratch database'.format(
+                                   connection.settings_dict['NAME']))
+        if options['iterations'] < 1:
+            raise CommandError('At least one iteration is required')
+        try:
+            baseline = None
+            if options['compare']:
+                with open(options['compare'], encoding='utf-8') as source:
+                    baseline = json.load(source)
+            results = run_benchmarks(options['iterations'], options['warmup'], options['only'])
+            if not results['endpoints']:
+                raise CommandError('No benchmark data, run generate_load_data first')
+            report = json.dumps(results, indent=2, sort_keys=True)
+            if options['output']:
+                with open(options['output'], 'w', encoding='utf-8') as output:
+                    output.write(report)
+            else:
+                self.stdout.write(report)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        if baseline is not None:
+            for line in compare(baseline, results):
+                self.stdout.write(line)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from polls.export import render_ndjson
+from polls.feed import FEED_BATCH_SIZE, FEED_FIELDS, FEED_GRACE, wait_feed
+
+
+class Command(BaseCommand):
+    help = ('Выводит голоса после курсора --since в NDJSON в порядке id. '
+            'id последней строки - курсор для следующего запуска')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=FEED_BATCH_SIZE,
+                            help='число голосов, читаемых за одно обращение')
+        parser.add_argument('--grace', type=float, default=FEED_GRACE.total_seconds(),
+                            help='не выводить голоса моложе этого числа секунд')
+        parser.add_argument('--follow', action='store_true',
+                            help='не завершаться, ожидая новые голоса')
+        parser.add_argument('--wait', type=float, default=30,
+                            help='сколько секунд ждать новые голоса за одно обращение в --follow')
+
+    def handle(self, *args, **options):
+        since = options['since']
+        grace = timedelta(seconds=options['grace'])
+        while True:
+            batch = wait_feed(since, options['batch_size'],
+                              options['wait'] if options['follow'] else 0, grace)
+            for line in render_ndjson(FEED_FIELDS, batch):
+                self.stdout.write(line, ending='')
+            if batch:
+                since = batch[-1][0]
+                self.stdout.flush()
+            elif not options['follow']:
+                return
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Manager
+from django.utils.timezone import get_current_timezone
+from rest_framework import ISO_8601, fields, serializers
+from rest_framework.settings import api_settings
+
+
+class RowMapper(object):
+    """
+    Заранее собранное по полям сериализатора преобразование строк в словари
+    того же вида, что и serializer.data, без обхода полей, OrderedDict
+    и ReturnDict на каждую строку. rows: 'values' для словарей из .values(),
+    'objects' для объектов моделей. Поля SerializerMethodField задаются
+    в overrides функциями от строки
+    """
+    def __init__(self, serializer_class, rows='objects', **overrides):
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if name in overrides:
+                self.columns.append((name, overrides[name], None))
+                continue
+            if isinstance(field, fields.SerializerMethodField):
+                raise ImproperlyConfigured('{} needs an override in RowMapper'.format(name))
+            if rows == 'values':
+                getter = itemgetter(field.source)
+            else:
+                getter = attrgetter('.'.join(field.source_attrs))
+            if isinstance(field, serializers.ListSerializer):
+                convert = RowMapper(field.child.__class__, rows).many
+            elif type(field) is fields.IntegerField:
+                convert = int
+            elif type(field) is fields.CharField:
+                convert = str
+            elif type(field) is fields.DateTimeField:
+                convert = datetime_representation(field)
+            else:
+                convert = field.to_representation
+            self.columns.append((name, getter, convert))
+
+    def __call__(self, row):
+        result = {}
+        for name, getter, convert in self.columns:
+            value = getter(row)
+            if convert is None:
+                result[name] = value
+            elif value is None:
+                # как Serializer.to_representation, None не преобразуется
+                result[name] = None
+            else:
+                result[name] = convert(value)
+        return result
+
+    def many(self, rows):
+        if isinstance(rows, Manager):
+            rows = rows.all()
+        return [self(row) for row in rows]
+
+
+def datetime_representation(field):
+    """
+    DateTimeField.to_representation для частого случая: формат ISO 8601,
+    время с часовым поясом и часовой пояс поля по умолчанию
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if (output_format is None or output_format.lower() != ISO_8601 or
+            hasattr(field, 'timezone') or not settings.USE_TZ):
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(get_current_timezone()).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+
+from .authentication import token_cache
+
+# верхние границы интервалов гистограммы задержек, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FLUSH_INTERVAL = getattr(settings, 'POLLS_METRICS_FLUSH_INTERVAL', 1.0)
+
+# файл с суммой метрик завершившихся воркеров
+EXITED_FILE = 'exited.json'
+
+
+def metrics_dir():
+    """
+    Каталог, в который каждый процесс сохраняет свои метрики в файл <pid>.json.
+    None - метрики только в памяти процесса
+    """
+    return getattr(settings, 'POLLS_METRICS_DIR', None)
+
+
+class QueryRecorder(object):
+    """
+    Обертка выполнения SQL, подсчитывающая число и время запросов
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def record_queries(recorder):
+    """
+    Подключает recorder ко всем соединениям с БД на время блока with
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class Registry(object):
+    """
+    Метрики запросов текущего процесса. Снимок периодически записывается
+    в каталог метрик, /metrics суммирует снимки всех процессов
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._views = {}
+        self._statuses = {}
+        self._flushed = 0.0
+
+    def observe(self, view, method, status, duration, queries, db_time, size):
+        key = '{}\t{}'.format(view, method)
+        with self._lock:
+            item = self._views.get(key)
+            if item is None:
+                item = self._views[key] = {
+                    'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0,
+                    'queries': 0, 'db_time': 0.0, 'bytes': 0,
+                }
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    item['buckets'][index] += 1
+            item['count'] += 1
+            item['sum'] += duration
+            item['queries'] += queries
+            item['db_time'] += db_time
+            item['bytes'] += size
+            status_key = '{}\t{}'.format(key, status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+        if time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'views': json.loads(json.dumps(self._views)),
+                'statuses': dict(self._statuses),
+                'token_cache': token_cache.stats(),
+            }
+
+    def flush(self):
+        """
+        Атомарно перезаписывает файл метрик процесса
+        """
+        directory = metrics_dir()
+        self._flushed = time.monotonic()
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        _write_snapshot(directory, '{}.json'.format(os.getpid()), self.snapshot())
+
+    def collect(self):
+        """
+        Возвращает снимки всех процессов. Метрики завершившихся процессов
+        собираются в EXITED_FILE, чтобы счетчики не уменьшались
+        """
+        directory = metrics_dir()
+        if not directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as source:
+                    snapshots.append(json.load(source))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._statuses.clear()
+
+
+registry = Registry()
+
+
+def _write_snapshot(directory, name, snapshot):
+    descriptor, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as output:
+        json.dump(snapshot, output)
+    os.replace(path, os.path.join(directory, name))
+
+
+def clear_metrics_dir():
+    """
+    Удаляет файлы метрик прежнего запуска, вызывается при запуске сервера
+    """
+    directory = metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+def retire_worker(pid):
+    """
+    Переносит метрики завершившегося воркера в общий файл EXITED_FILE:
+    счетчики не уменьшаются, а файлы воркеров не накапливаются.
+    Вызывается мастер-процессом после завершения воркера
+    """
+    directory = metrics_dir()
+    if not directory:
+        return
+    path = os.path.join(directory, '{}.json'.format(pid))
+    if not os.path.exists(path):
+        return
+    snapshots = []
+    for source_path in (os.path.join(directory, EXITED_FILE), path):
+        try:
+            with open(source_path) as source:
+                snapshots.append(json.load(source))
+        except (OSError, ValueError):
+            continue
+    views, statuses, cache_stats = merge(snapshots)
+    # токены завершившегося воркера больше не хранятся
+    cache_stats['size'] = 0
+    _write_snapshot(directory, EXITED_FILE,
+                    {'views': views, 'statuses': statuses, 'token_cache': cache_stats})
+    os.remove(path)
+
+
+def merge(snapshots):
+    views = {}
+    statuses = {}
+    cache_stats = {'hits': 0, 'misses': 0, 'size': 0}
+    for snapshot in snapshots:
+        for key, item in snapshot['views'].items():
+            total = views.get(key)
+            if total is None:
+                views[key] = json.loads(json.dumps(item))
+                continue
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], item['buckets'])]
+            for field in ('count', 'sum', 'queries', 'db_time', 'bytes'):
+                total[field] += item[field]
+        for key, count in snapshot['statuses'].items():
+            statuses[key] = statuses.get(key, 0) + count
+        for field in cache_stats:
+            cache_stats[field] += snapshot['token_cache'][field]
+    return views, statuses, cache_stats
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels.items()) + '}'
+
+
+def render_metrics():
+    """
+    Метрики всех процессов в текстовом формате Prometheus
+    """
+    views, statuses, cache_stats = merge(registry.collect())
+    lines = [
+        '# HELP polls_request_duration_seconds Request latency.',
+        '# TYPE polls_request_duration_seconds histogram',
+    ]
+    for key in sorted(views):
+        view, method = key.split('\t')
+        item = views[key]
+        for bound, count in zip(LATENCY_BUCKETS, item['buckets']):
+            lines.append('polls_request_duration_seconds_bucket{} {}'.format(
+                _labels(view=view, method=method, le=bound), count))
+        lines.append('polls_request_duration_seconds_bucket{} {}'.format(
+            _labels(view=view, method=method, le='+Inf'), item['count']))
+        lines.append('polls_request_duration_seconds_sum{} {}'.format(
+            _labels(view=view, method=method), item['sum']))
+        lines.append('polls_request_duration_seconds_count{} {}'.format(
+            _labels(view=view, method=method), item['count']))
+
+    counters = (
+        ('polls_db_queries_total', 'SQL queries executed.', 'queries'),
+        ('polls_db_duration_seconds_total', 'Time spent in SQL queries.', 'db_time'),
+        ('polls_response_bytes_total', 'Response body size.', 'bytes'),
+    )
+    for name, description, field in counters:
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} counter'.format(name))
+        for key in sorted(views):
+            view, method = key.split('\t')
+            lines.append('{}{} {}'.format(name, _labels(view=view, method=method),
+                                          views[key][field]))
+
+    lines.append('# HELP polls_responses_total Responses by status code.')
+    lines.append('# TYPE polls_responses_total counter')
+    for key in sorted(statuses):
+        view, method, code = key.split('\t')
+        lines.append('polls_responses_total{} {}'.format(
+            _labels(view=view, method=method, status=code), statuses[key]))
+
+    lines.append('# HELP polls_token_cache_requests_total Token cache lookups.')
+    lines.append('# TYPE polls_token_cache_requests_total counter')
+    lines.append('polls_token_cache_requests_total{} {}'.format(
+        _labels(result='hit'), cache_stats['hits']))
+    lines.append('polls_token_cache_requests_total{} {}'.format(
+        _labels(result='miss'), cache_stats['misses']))
+    lines.append('# HELP polls_token_cache_size Cached tokens in all workers.')
+    lines.append('# TYPE polls_token_cache_size gauge')
+    lines.append('polls_token_cache_size {}'.format(cache_stats['size']))
+    return '\n'.join(lines) + '\n'
+
+
+class Sample(object):
+    def __init__(self, request):
+        self.request = request
+        self.start = time.perf_counter()
+        self.recorder = QueryRecorder()
+        self.size = 0
+
+    def finish(self, response):
+        match = self.request.resolver_match
+        registry.observe(match.view_name if match else 'unmatched', self.request.method,
+                         response.status_code, time.perf_counter() - self.start,
+                         self.recorder.count, self.recorder.duration, self.size)
+
+
+class MetricsMiddleware(object):
+    """
+    Собирает по каждому представлению задержку, число и время SQL запросов
+    и размер ответа, добавляет заголовок Server-Timing. Для потоковых ответов
+    метрики учитываются после отдачи последнего блока, а заголовок содержит
+    время до начала ответа
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample = Sample(request)
+        with record_queries(sample.recorder):
+            response = self.get_response(request)
+        response['Server-Timing'] = 'app;dur={:.1f}, db;dur={:.1f};desc="{} queries"'.format(
+            (time.perf_counter() - sample.start) * 1000, sample.recorder.duration * 1000,
+            sample.recorder.count)
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, sample, response)
+        else:
+            sample.size = len(response.content)
+            sample.finish(response)
+        return response
+
+    def stream(self, content, sample, response):
+        iterator = iter(content)
+        try:
+            while True:
+                with record_queries(sample.recorder):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                sample.size += len(chunk)
+                yield chunk
+        finally:
+            sample.finish(response)
@@ -0,0 +1,53 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tallies(apps, schema_editor):
+    Answer = apps.get_model('polls', 'Answer')
+    Question = apps.get_model('polls', 'Question')
+    Vote = apps.get_model('polls', 'Vote')
+    VoteTally = apps.get_model('polls', 'VoteTally')
+    QuestionTally = apps.get_model('polls', 'QuestionTally')
+
+    counts = dict(Vote.objects.values_list('answer').annotate(
+        count=models.Count('id')).order_by())
+    totals = dict(Vote.objects.values_list('question').annotate(
+        total=models.Count('id')).order_by())
+    VoteTally.objects.bulk_create(
+        VoteTally(question_id=question_id, answer_id=answer_id, count=counts.get(answer_id, 0))
+        for answer_id, question_id in Answer.objects.values_list('id', 'question')
+    )
+    QuestionTally.objects.bulk_create(
+        QuestionTally(question_id=question_id, total=totals.get(question_id, 0))
+        for question_id in Question.objects.values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionTally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='всего голосов')),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='polls.Question', verbose_name='опрос')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteTally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='число голосов')),
+                ('answer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='polls.Answer', verbose_name='вариант ответа')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question', verbose_name='опрос')),
+            ],
+        ),
+        migrations.RunPython(fill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """
+    Удаляет повторные голоса пользователя в опросе, оставляя самый ранний,
+    и пересчитывает счетчики затронутых опросов: с повторами ограничение
+    уникальности не создастся
+    """
+    Vote = apps.get_model('polls', 'Vote')
+    VoteTally = apps.get_model('polls', 'VoteTally')
+    QuestionTally = apps.get_model('polls', 'QuestionTally')
+
+    duplicates = list(Vote.objects.values('user', 'question').annotate(
+        first=models.Min('id'), votes=models.Count('id')).filter(votes__gt=1).order_by())
+    for duplicate in duplicates:
+        Vote.objects.filter(user=duplicate['user'], question=duplicate['question']).exclude(
+            id=duplicate['first']).delete()
+
+    for question_id in {duplicate['question'] for duplicate in duplicates}:
+        votes = Vote.objects.filter(question=question_id)
+        counts = dict(votes.values_list('answer').annotate(count=models.Count('id')).order_by())
+        for tally in VoteTally.objects.filter(question=question_id):
+            tally.count = counts.get(tally.answer_id, 0)
+            tally.save(update_fields=['count'])
+        QuestionTally.objects.filter(question=question_id).update(total=votes.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0002_vote_tallies'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='vote',
+            unique_together={('user', 'question')},
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['date_end', 'date_start'], name='polls_question_active_idx'),
+        ),
+    ]
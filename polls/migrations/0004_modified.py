@@ -0,0 +1,23 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_vote_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='время изменения'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='время изменения'),
+        ),
+    ]
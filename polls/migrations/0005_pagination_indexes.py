@@ -0,0 +1,21 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_modified'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date', 'id'], name='polls_question_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='votetally',
+            index=models.Index(fields=['question', 'answer'], name='polls_tally_page_idx'),
+        ),
+    ]
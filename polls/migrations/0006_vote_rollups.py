@@ -0,0 +1,79 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourVoteRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='начало интервала')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='число голосов')),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Answer', verbose_name='вариант ответа')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question', verbose_name='опрос')),
+            ],
+            options={
+                'ordering': ('bucket', 'answer'),
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MinuteVoteRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='начало интервала')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='число голосов')),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Answer', verbose_name='вариант ответа')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question', verbose_name='опрос')),
+            ],
+            options={
+                'ordering': ('bucket', 'answer'),
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='обработчик')),
+                ('position', models.BigIntegerField(default=0, verbose_name='позиция')),
+            ],
+        ),
+        # существующие голоса остаются без времени, значение по умолчанию
+        # назначается только новым записям
+        migrations.AddField(
+            model_name='vote',
+            name='created',
+            field=models.DateTimeField(null=True, verbose_name='время голосования'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, null=True, verbose_name='время голосования'),
+        ),
+        migrations.AddIndex(
+            model_name='minutevoterollup',
+            index=models.Index(fields=['question', 'bucket'], name='polls_minute_rollup_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='minutevoterollup',
+            unique_together={('answer', 'bucket')},
+        ),
+        migrations.AddIndex(
+            model_name='hourvoterollup',
+            index=models.Index(fields=['question', 'bucket'], name='polls_hour_rollup_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hourvoterollup',
+            unique_together={('answer', 'bucket')},
+        ),
+    ]
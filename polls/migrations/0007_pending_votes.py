@@ -0,0 +1,36 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0006_vote_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingVote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время голосования')),
+                ('state', models.CharField(choices=[('pending', 'ожидает записи'), ('rejected', 'отклонен')], default='pending', max_length=10, verbose_name='состояние')),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Answer', verbose_name='выбранный ответ')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question', verbose_name='ответ к опросу')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pendingvote',
+            index=models.Index(fields=['state', 'id'], name='polls_pending_vote_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pendingvote',
+            unique_together={('user', 'question')},
+        ),
+    ]
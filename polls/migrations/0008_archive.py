@@ -0,0 +1,49 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0007_pending_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(verbose_name='число голосов')),
+                ('answer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='polls.Answer', verbose_name='вариант ответа')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question', verbose_name='опрос')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedVote',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(null=True, verbose_name='время голосования')),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='polls.Answer', verbose_name='выбранный ответ')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='polls.Question', verbose_name='ответ к опросу')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(verbose_name='всего голосов')),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время архивации')),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='polls.Question', verbose_name='опрос')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='answersnapshot',
+            index=models.Index(fields=['question', 'answer'], name='polls_snapshot_page_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.11 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='recorded',
+            field=models.DateTimeField(auto_now_add=True, null=True, verbose_name='время записи'),
+        ),
+    ]
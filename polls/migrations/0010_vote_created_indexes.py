@@ -0,0 +1,21 @@
+# Generated by Django 2.1.11 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_vote_recorded'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedvote',
+            index=models.Index(fields=['created'], name='polls_archived_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['created'], name='polls_vote_created_idx'),
+        ),
+    ]
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+import atexit
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from hashlib import blake2b
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'PLLSMMC1'
+FILE_HEADER_SIZE = 4096
+# счетчик версии, хеш ключа, срок жизни, время обращения, длины ключа и значения, crc
+SLOT_HEADER = struct.Struct('<QQddIII')
+SLOT_HEADER_SIZE = 48
+SEQUENCE = struct.Struct('<Q')
+ACCESSED = struct.Struct('<d')
+ACCESSED_OFFSET = 24
+
+# таблицы слотов по умолчанию: (размер слота, число слотов)
+DEFAULT_TABLES = ((1024, 8192), (64 * 1024, 256), (4 * 1024 * 1024, 8))
+DEFAULT_WAYS = 8
+
+# число попыток чтения без блокировки, пока запись в слот не завершится
+READ_RETRIES = 16
+
+# число блокировок потоков, между которыми распределяются наборы слотов
+LOCK_STRIPES = 64
+
+
+class Table(object):
+    """
+    Таблица слотов одного размера, разбитая на наборы по ways слотов
+    """
+    def __init__(self, offset, slot_size, slots, ways):
+        self.offset = offset
+        self.slot_size = slot_size
+        self.ways = min(ways, slots)
+        self.sets = slots // self.ways
+        self.set_size = self.ways * slot_size
+        self.size = self.sets * self.set_size
+        self.capacity = slot_size - SLOT_HEADER_SIZE
+
+    def slots(self, digest):
+        """
+        Смещения слотов набора, в котором может лежать ключ с хешем digest
+        """
+        base = self.offset + (digest % self.sets) * self.set_size
+        return range(base, base + self.set_size, self.slot_size)
+
+
+class Mapping(object):
+    """
+    Файл кэша, открытый процессом: дескриптор для lockf, отображение
+    и блокировки наборов для потоков процесса
+    """
+    def __init__(self, fd, size):
+        self.pid = os.getpid()
+        self.fd = fd
+        self.map = mmap.mmap(fd, size)
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+# файлы кэша, открытые процессом: (pid, путь, заголовок) -> Mapping.
+# Django создает экземпляр кэша в каждом потоке, а блокировки lockf
+# принадлежат процессу, поэтому дескриптор и блокировки потоков общие
+# для всех экземпляров процесса с одним файлом
+_mappings = {}
+_mappings_lock = threading.Lock()
+
+
+def open_mapping(path, size, header):
+    """
+    Возвращает отображение файла кэша текущего процесса, при первом обращении
+    открывает файл и обнуляет его, если заголовок или размер не совпадают
+    """
+    key = (os.getpid(), path, header)
+    with _mappings_lock:
+        mapping = _mappings.get(key)
+        if mapping is not None:
+            return mapping
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # файл чужого пользователя или ссылка на него могли бы подложить
+        # в кэш данные, которые выполнятся при распаковке pickle
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            if os.fstat(fd).st_uid != os.getuid():
+                raise ImproperlyConfigured(
+                    'Cache file {} is owned by another user'.format(path))
+            fcntl.lockf(fd, fcntl.LOCK_EX, FILE_HEADER_SIZE, 0)
+            try:
+                if (os.pread(fd, len(header), 0) != header or
+                        os.fstat(fd).st_size != size):
+                    # новый файл или файл с другими таблицами: слоты обнуляются
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, header, 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, FILE_HEADER_SIZE, 0)
+            mapping = Mapping(fd, size)
+        except Exception:
+            os.close(fd)
+            raise
+        _mappings[key] = mapping
+        return mapping
+
+
+@atexit.register
+def close_mappings():
+    with _mappings_lock:
+        for key, mapping in list(_mappings.items()):
+            if mapping.pid == os.getpid():
+                mapping.close()
+                del _mappings[key]
+
+
+class MmapCache(BaseCache):
+    """
+    Кэш в отображенном в память файле, общий для всех процессов на одном хосте.
+    Файл состоит из таблиц слотов фиксированного размера (OPTIONS TABLES -
+    пары размер слота, число слотов), запись кладется в таблицу с наименьшими
+    подходящими слотами. Таблица разбита на наборы по WAYS слотов: ключ
+    хранится в одном из слотов своего набора, при переполнении набора
+    вытесняется давно не использованная запись. Чтение идет без блокировок:
+    слот перечитывается, если его версия или контрольная сумма изменились
+    во время чтения. Запись блокирует только свой набор: lockf на диапазон
+    байт файла между процессами и общая для процесса блокировка потока.
+    Все экземпляры процесса с одним файлом используют один дескриптор
+    и одно отображение. Значения больше самого крупного слота не кэшируются.
+
+    LOCATION - путь к файлу, принадлежащему пользователю процесса
+    """
+    def __init__(self, location, params):
+        super(MmapCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = os.path.abspath(location)
+        ways = int(options.get('WAYS', DEFAULT_WAYS))
+        self.tables = []
+        offset = FILE_HEADER_SIZE
+        for slot_size, slots in sorted(options.get('TABLES', DEFAULT_TABLES)):
+            table = Table(offset, int(slot_size), int(slots), ways)
+            self.tables.append(table)
+            offset += table.size
+        self.size = offset
+        self.header = MAGIC + repr([(table.slot_size, table.sets, table.ways)
+                                    for table in self.tables]).encode()
+        self._mapping = None
+
+    # файл
+
+    @property
+    def mapping(self):
+        mapping = self._mapping
+        if mapping is None or mapping.pid != os.getpid():
+            # после fork процесс открывает файл заново со своими блокировками
+            mapping = self._mapping = open_mapping(self.path, self.size, self.header)
+        return mapping
+
+    @property
+    def map(self):
+        return self.mapping.map
+
+    @contextmanager
+    def _locked(self, table, digest):
+        mapping = self.mapping
+        offset = table.slots(digest)[0]
+        with mapping.locks[(offset // table.set_size) % LOCK_STRIPES]:
+            fcntl.lockf(mapping.fd, fcntl.LOCK_EX, table.set_size, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(mapping.fd, fcntl.LOCK_UN, table.set_size, offset)
+
+    # слоты
+
+    def _read_slot(self, offset):
+        """
+        Возвращает (хеш, срок, ключ, значение) согласованного состояния слота
+        или None, если запись в слот не завершилась за READ_RETRIES попыток
+        """
+        data = self.map
+        for _ in range(READ_RETRIES):
+            sequence, digest, expires, _, key_length, value_length, crc = (
+                SLOT_HEADER.unpack_from(data, offset))
+            if sequence % 2:
+                continue
+            start = offset + SLOT_HEADER_SIZE
+            payload = data[start:start + key_length + value_length]
+            if SEQUENCE.unpack_from(data, offset)[0] != sequence or zlib.crc32(payload) != crc:
+                continue
+            return digest, expires, payload[:key_length], payload[key_length:]
+        return None
+
+    def _write_slot(self, offset, digest, expires, key, value):
+        data = self.map
+        sequence = SEQUENCE.unpack_from(data, offset)[0] + 1
+        # нечетная версия: слот записывается, читатели его пропускают
+        SEQUENCE.pack_into(data, offset, sequence)
+        payload = key + value
+        start = offset + SLOT_HEADER_SIZE
+        data[start:start + len(payload)] = payload
+        SLOT_HEADER.pack_into(data, offset, sequence, digest, expires, time.time(),
+                              len(key), len(value), zlib.crc32(payload))
+        SEQUENCE.pack_into(data, offset, sequence + 1)
+
+    def _find(self, table, key, digest):
+        """
+        Ищет живую запись ключа в таблице, возвращает (смещение, срок, значение) или None
+        """
+        for offset in table.slots(digest):
+            if SLOT_HEADER.unpack_from(self.map, offset)[1] != digest:
+                continue
+            slot = self._read_slot(offset)
+            if slot is None or slot[0] != digest or slot[2] != key:
+                continue
+            expires = slot[1]
+            if expires and expires <= time.time():
+                return None
+            return offset, expires, slot[3]
+        return None
+
+    def _lookup(self, key, digest):
+        for table in self.tables:
+            found = self._find(table, key, digest)
+            if found is not None:
+                return table, found
+        return None, None
+
+    def _victim(self, table, key, digest):
+        """
+        Слот для записи ключа: слот этого же ключа, пустой или просроченный слот,
+        иначе давно не использованный. Вызывается под блокировкой набора
+        """
+        now = time.time()
+        victim = None
+        for offset in table.slots(digest):
+            _, slot_digest, expires, accessed, key_length, _, _ = SLOT_HEADER.unpack_from(
+                self.map, offset)
+            start = offset + SLOT_HEADER_SIZE
+            if slot_digest == digest and self.map[start:start + key_length] == key:
+                return offset
+            # свободный и просроченный слоты занимаются раньше любого живого
+            rank = accessed if slot_digest and not (expires and expires <= now) else -1.0
+            if victim is None or rank < victim[0]:
+                victim = (rank, offset)
+        return victim[1]
+
+    def _remove(self, table, key, digest):
+        if self._find(table, key, digest) is None:
+            # проверка без блокировки: обычно ключа в таблице нет
+            return False
+        with self._locked(table, digest):
+            found = self._find(table, key, digest)
+            if found is not None:
+                self._write_slot(found[0], 0, 0.0, b'', b'')
+        return found is not None
+
+    def _encode(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key = key.encode()
+        digest = int.from_bytes(blake2b(key, digest_size=8).digest(), 'little')
+        # нулевой хеш означает пустой слот
+        return key, digest | 1
+
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return 0.0 if expires is None else expires
+
+    def _store(self, key, value, timeout, version, only_new=False):
+        key, digest = self._encode(key, version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self._expiry(timeout)
+        target = None
+        for table in self.tables:
+            if target is None and len(key) + len(value) <= table.capacity:
+                target = table
+            elif not only_new:
+                # прежнее значение другого размера лежит в другой таблице
+                self._remove(table, key, digest)
+        if target is None:
+            return False
+        with self._locked(target, digest):
+            if only_new and self._lookup(key, digest)[1] is not None:
+                return False
+            self._write_slot(self._victim(target, key, digest), digest, expires, key, value)
+        return True
+
+    # интерфейс кэша Django
+
+    def get(self, key, default=None, version=None):
+        key, digest = self._encode(key, version)
+        found = self._lookup(key, digest)[1]
+        if found is None:
+            return default
+        offset, _, value = found
+        # время обращения для вытеснения обновляется без блокировки
+        ACCESSED.pack_into(self.map, offset + ACCESSED_OFFSET, time.time())
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, only_new=True)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key, digest = self._encode(key, version)
+        for table in self.tables:
+            with self._locked(table, digest):
+                found = self._find(table, key, digest)
+                if found is not None:
+                    self._write_slot(found[0], digest, self._expiry(timeout), key, found[2])
+                    return True
+        return False
+
+    def incr(self, key, delta=1, version=None):
+        encoded, digest = self._encode(key, version)
+        for table in self.tables:
+            with self._locked(table, digest):
+                found = self._find(table, encoded, digest)
+                if found is None:
+                    continue
+                offset, expires, value = found
+                value = pickle.loads(value) + delta
+                data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                if len(encoded) + len(data) <= table.capacity:
+                    self._write_slot(offset, digest, expires, encoded, data)
+                    return value
+            # значение выросло из слота своей таблицы
+            self.set(key, value, expires - time.time() if expires else None, version)
+            return value
+        raise ValueError("Key '%s' not found" % key)
+
+    def has_key(self, key, version=None):
+        key, digest = self._encode(key, version)
+        return self._lookup(key, digest)[1] is not None
+
+    def delete(self, key, version=None):
+        key, digest = self._encode(key, version)
+        for table in self.tables:
+            self._remove(table, key, digest)
+
+    def clear(self):
+        for table in self.tables:
+            for set_index in range(table.sets):
+                with self._locked(table, set_index):
+                    for offset in table.slots(set_index):
+                        if SLOT_HEADER.unpack_from(self.map, offset)[1]:
+                            self._write_slot(offset, 0, 0.0, b'', b'')
+
+    def close(self, **kwargs):
+        # вызывается после каждого запроса: файл остается открытым
+        # до завершения процесса и используется другими экземплярами
+        pass
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.db import models
 from django.conf import settings
+from django.utils.timezone import now
 
 
 class Question(models.Model):
@@ -15,6 +16,14 @@ class Question(models.Model):
     pub_date = models.DateTimeField(verbose_name='время публикации', auto_now_add=True)
     date_start = models.DateTimeField(verbose_name='опрос активен после')
     date_end = models.DateTimeField(verbose_name='опрос активен до')
+    modified = models.DateTimeField(verbose_name='время изменения', auto_now=True)
+
+    class Meta:
+        # индексы для выборки активных на текущее время опросов и постраничного вывода
+        indexes = [
+            models.Index(fields=['date_end', 'date_start'], name='polls_question_active_idx'),
+            models.Index(fields=['pub_date', 'id'], name='polls_question_pub_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -28,6 +37,7 @@ class Answer(models.Model):
                                  on_delete=models.PROTECT,
                                  verbose_name='опрос')
     answer_text = models.CharField(verbose_name='текст ответа', max_length=250)
+    modified = models.DateTimeField(verbose_name='время изменения', auto_now=True)
 
     def __str__(self):
         return self.answer_text
@@ -46,3 +56,201 @@ class Vote(models.Model):
     answer = models.ForeignKey(Answer,
                                on_delete=models.PROTECT,
                                verbose_name='выбранный ответ')
+    # у голосов, записанных до появления поля, время неизвестно
+    created = models.DateTimeField(verbose_name='время голосования', default=now, null=True)
+    # время вставки строки: created переносится из очереди и импорта и может
+    # быть намного раньше. По нему лента и сводки ждут незафиксированные транзакции
+    recorded = models.DateTimeField(verbose_name='время записи', auto_now_add=True, null=True)
+
+    class Meta:
+        # пользователь может проголосовать в опросе только один раз
+        unique_together = ('user', 'question')
+        # индекс для фильтра админки по времени голосования
+        indexes = [
+            models.Index(fields=['created'], name='polls_vote_created_idx'),
+        ]
+
+
+class VoteTally(models.Model):
+    """
+    Счетчик голосов за вариант ответа, обновляется вместе с записью голоса
+    """
+    question = models.ForeignKey(Question,
+                                 on_delete=models.CASCADE,
+                                 verbose_name='опрос')
+    answer = models.OneToOneField(Answer,
+                                  on_delete=models.CASCADE,
+                                  related_name='tally',
+                                  verbose_name='вариант ответа')
+    count = models.PositiveIntegerField(verbose_name='число голосов', default=0)
+
+    class Meta:
+        # индекс для постраничного вывода статистики
+        indexes = [
+            models.Index(fields=['question', 'answer'], name='polls_tally_page_idx'),
+        ]
+
+    def __str__(self):
+        return '{}: {}'.format(self.answer_id, self.count)
+
+
+class QuestionTally(models.Model):
+    """
+    Общее число голосов по опросу
+    """
+    question = models.OneToOneField(Question,
+                                    on_delete=models.CASCADE,
+                                    related_name='tally',
+                                    verbose_name='опрос')
+    total = models.PositiveIntegerField(verbose_name='всего голосов', default=0)
+
+    def __str__(self):
+        return '{}: {}'.format(self.question_id, self.total)
+
+
+class VoteRollup(models.Model):
+    """
+    Число голосов за вариант ответа в интервале времени
+    """
+    question = models.ForeignKey(Question,
+                                 on_delete=models.CASCADE,
+                                 verbose_name='опрос')
+    answer = models.ForeignKey(Answer,
+                               on_delete=models.CASCADE,
+                               verbose_name='вариант ответа')
+    bucket = models.DateTimeField(verbose_name='начало интервала')
+    count = models.PositiveIntegerField(verbose_name='число голосов', default=0)
+
+    class Meta:
+        abstract = True
+        unique_together = ('answer', 'bucket')
+        ordering = ('bucket', 'answer')
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.bucket, self.answer_id, self.count)
+
+
+class MinuteVoteRollup(VoteRollup):
+    """
+    Поминутное число голосов
+    """
+    class Meta(VoteRollup.Meta):
+        indexes = [
+            models.Index(fields=['question', 'bucket'], name='polls_minute_rollup_idx'),
+        ]
+
+
+class HourVoteRollup(VoteRollup):
+    """
+    Почасовое число голосов
+    """
+    class Meta(VoteRollup.Meta):
+        indexes = [
+            models.Index(fields=['question', 'bucket'], name='polls_hour_rollup_idx'),
+        ]
+
+
+class Watermark(models.Model):
+    """
+    Позиция, до которой инкрементальная обработка уже учла данные
+    """
+    name = models.CharField(verbose_name='обработчик', max_length=50, unique=True)
+    position = models.BigIntegerField(verbose_name='позиция', default=0)
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.position)
+
+
+class PendingVote(models.Model):
+    """
+    Проверенный голос, ожидающий записи в Vote в режиме отложенной записи
+    """
+    PENDING = 'pending'
+    REJECTED = 'rejected'
+    STATES = (
+        (PENDING, 'ожидает записи'),
+        (REJECTED, 'отклонен'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             verbose_name='пользователь')
+    question = models.ForeignKey(Question,
+                                 on_delete=models.CASCADE,
+                                 verbose_name='ответ к опросу')
+    answer = models.ForeignKey(Answer,
+                               on_delete=models.CASCADE,
+                               verbose_name='выбранный ответ')
+    created = models.DateTimeField(verbose_name='время голосования', default=now)
+    state = models.CharField(verbose_name='состояние', max_length=10,
+                             choices=STATES, default=PENDING)
+
+    class Meta:
+        # в очереди, как и в Vote, у пользователя один голос в опросе
+        unique_together = ('user', 'question')
+        indexes = [
+            models.Index(fields=['state', 'id'], name='polls_pending_vote_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.user_id, self.question_id, self.state)
+
+
+class QuestionSnapshot(models.Model):
+    """
+    Итоговое число голосов закрытого опроса, фиксируется при архивации
+    """
+    question = models.OneToOneField(Question,
+                                    on_delete=models.CASCADE,
+                                    related_name='snapshot',
+                                    verbose_name='опрос')
+    total = models.PositiveIntegerField(verbose_name='всего голосов')
+    archived = models.DateTimeField(verbose_name='время архивации', default=now)
+
+    def __str__(self):
+        return '{}: {}'.format(self.question_id, self.total)
+
+
+class AnswerSnapshot(models.Model):
+    """
+    Итоговое число голосов за вариант ответа закрытого опроса
+    """
+    question = models.ForeignKey(Question,
+                                 on_delete=models.CASCADE,
+                                 verbose_name='опрос')
+    answer = models.OneToOneField(Answer,
+                                  on_delete=models.CASCADE,
+                                  related_name='snapshot',
+                                  verbose_name='вариант ответа')
+    count = models.PositiveIntegerField(verbose_name='число голосов')
+
+    class Meta:
+        # индекс для постраничного вывода статистики
+        indexes = [
+            models.Index(fields=['question', 'answer'], name='polls_snapshot_page_idx'),
+        ]
+
+    def __str__(self):
+        return '{}: {}'.format(self.answer_id, self.count)
+
+
+class ArchivedVote(models.Model):
+    """
+    Голос в закрытом опросе, перенесенный из Vote с сохранением id
+    """
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.PROTECT,
+                             verbose_name='пользователь')
+    question = models.ForeignKey(Question,
+                                 on_delete=models.PROTECT,
+                                 verbose_name='ответ к опросу')
+    answer = models.ForeignKey(Answer,
+                               on_delete=models.PROTECT,
+                               verbose_name='выбранный ответ')
+    created = models.DateTimeField(verbose_name='время голосования', null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created'], name='polls_archived_created_idx'),
+        ]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import heapq
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Постраничный вывод по курсору, содержащему ключ крайней выданной записи.
+    В отличие от CursorPagination записи сравниваются по всем полям ordering,
+    поэтому смещение не нужно, а курсоры не сдвигаются при добавлении записей.
+    Работает с QuerySet, кортежем QuerySet с непересекающимися ключами
+    и с уже упорядоченным по ordering списком
+    """
+    ordering = ('id',)
+    page_size = getattr(settings, 'POLLS_PAGE_SIZE', 100)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'POLLS_MAX_PAGE_SIZE', 1000)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.position, self.reverse = self.decode_cursor(request)
+        try:
+            if isinstance(queryset, QuerySet):
+                rows = self._slice_queryset(queryset)
+            elif isinstance(queryset, tuple):
+                # страница из каждого источника, затем слияние по ключу
+                rows = list(islice(heapq.merge(
+                    *[self._slice_queryset(part) for part in queryset],
+                    key=self.get_key, reverse=self.reverse), self.page_size + 1))
+            else:
+                rows = self._slice_list(queryset)
+        except (TypeError, ValueError, ValidationError):
+            # типы значений курсора не совпадают с полями упорядочивания
+            raise NotFound(self.invalid_cursor_message)
+
+        # одна лишняя запись показывает, есть ли следующая страница в направлении обхода
+        self.has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+        return self.page
+
+    def _slice_queryset(self, queryset):
+        lookup = 'lt' if self.reverse else 'gt'
+        if self.position is not None:
+            # лексикографическое сравнение (a, b) > (x, y): a > x or (a = x and b > y)
+            condition = Q()
+            for index, field in enumerate(self.ordering):
+                term = Q(**{'{}__{}'.format(field, lookup): self.position[index]})
+                for equal_field, value in zip(self.ordering[:index], self.position[:index]):
+                    term &= Q(**{equal_field: value})
+                condition |= term
+            queryset = queryset.filter(condition)
+        ordering = ['-' + field if self.reverse else field for field in self.ordering]
+        return list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+    def _slice_list(self, items):
+        if self.reverse:
+            end = self._bisect(items, self.position, right=False)
+            return items[max(0, end - self.page_size - 1):end][::-1]
+        start = 0 if self.position is None else self._bisect(items, self.position, right=True)
+        return items[start:start + self.page_size + 1]
+
+    def _bisect(self, items, position, right):
+        low, high = 0, len(items)
+        while low < high:
+            middle = (low + high) // 2
+            key = self.get_key(items[middle])
+            if key < position or (right and key == position):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get_key(self, item):
+        if isinstance(item, dict):
+            return tuple(item[field] for field in self.ordering)
+        return tuple(getattr(item, field) for field in self.ordering)
+
+    def get_next_link(self):
+        if self.reverse:
+            position = self.get_key(self.page[-1]) if self.page else self.position
+            return self.encode_cursor((position, False))
+        if self.has_more:
+            return self.encode_cursor((self.get_key(self.page[-1]), False))
+        return None
+
+    def get_previous_link(self):
+        if self.reverse:
+            if self.has_more:
+                return self.encode_cursor((self.get_key(self.page[0]), True))
+            return None
+        if self.position is not None:
+            position = self.get_key(self.page[0]) if self.page else self.position
+            return self.encode_cursor((position, True))
+        return None
+
+    def encode_cursor(self, cursor):
+        position, reverse = cursor
+        values = [value.isoformat() if isinstance(value, datetime) else value
+                  for value in position]
+        token = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            token = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            values = token['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = tuple(parse_datetime(value) if isinstance(value, str) else value
+                             for value in values)
+            if any(value is None or isinstance(value, bool) or not isinstance(value, (int, datetime))
+                   for value in position):
+                raise ValueError
+            return position, bool(token.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class QuestionPagination(KeysetPagination):
+    ordering = ('pub_date', 'id')
+
+
+class StatisticPagination(KeysetPagination):
+    ordering = ('question', 'answer')
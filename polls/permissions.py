@@ -1,11 +1,47 @@
 # -*- coding: utf-8 -*-
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework.permissions import BasePermission
 
+from .routers import INVALIDATED, invalidate_cache, primary_reads
+
+USER_GROUPS_KEY = 'polls:user_groups:{}'
+
+# время жизни записи ограничивает устаревание в воркерах, не получивших сигнал
+USER_GROUPS_TIMEOUT = 300
+
+
+def get_user_groups(user):
+    """
+    Возвращает кэшированное множество названий групп пользователя
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = USER_GROUPS_KEY.format(user.pk)
+    groups = cache.get(key)
+    if groups is None or groups == INVALIDATED:
+        with primary_reads(groups == INVALIDATED):
+            groups = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, groups, USER_GROUPS_TIMEOUT)
+    return groups
+
+
+def invalidate_user_groups(user_ids):
+    """
+    Сбрасывает кэш групп для перечисленных пользователей сразу и повторно
+    после фиксации транзакции, чтобы не остался набор групп, прочитанный
+    до фиксации изменений
+    """
+    keys = [USER_GROUPS_KEY.format(user_id) for user_id in user_ids]
+    invalidate_cache(keys)
+    transaction.on_commit(lambda: invalidate_cache(keys))
+
 
 class ClientPermission(BasePermission):
     """
     Проверяет наличие прав суперюзера или членство в группе Clients
     """
     def has_permission(self, request, view):
-        is_client = request.user.groups.filter(name='Clients').exists()
-        return request.user.is_superuser or is_client
+        if request.user.is_superuser:
+            return True
+        return 'Clients' in get_user_groups(request.user)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import hmac
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+class ProfilingMiddleware(object):
+    """
+    Выполняет под cProfile долю POLLS_PROFILE_RATE запросов и запросы
+    с заголовком X-Profile, равным POLLS_PROFILE_TOKEN. Профили в формате
+    pstats сохраняются в POLLS_PROFILE_DIR, хранятся последние POLLS_PROFILE_KEEP.
+    Если профилирование выключено, middleware не подключается.
+    У потоковых ответов профилируется только формирование заголовков
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rate = getattr(settings, 'POLLS_PROFILE_RATE', 0)
+        self.token = getattr(settings, 'POLLS_PROFILE_TOKEN', None)
+        if self.rate <= 0 and not self.token:
+            raise MiddlewareNotUsed
+        self.directory = getattr(settings, 'POLLS_PROFILE_DIR', None) or os.path.join(
+            tempfile.gettempdir(), 'polls_profiles')
+        self.keep = getattr(settings, 'POLLS_PROFILE_KEEP', 100)
+
+    def __call__(self, request):
+        requested = self.requested(request)
+        if not requested and not (self.rate > 0 and random.random() < self.rate):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        name = self.save(profiler, request)
+        if requested:
+            response['X-Profile-File'] = name
+        return response
+
+    def requested(self, request):
+        header = request.META.get(PROFILE_HEADER)
+        return bool(self.token and header and hmac.compare_digest(header, self.token))
+
+    def save(self, profiler, request):
+        """
+        Сохраняет профиль и удаляет самые старые файлы сверх POLLS_PROFILE_KEEP
+        """
+        match = request.resolver_match
+        view = (match.view_name if match else 'unmatched').replace(':', '.')
+        name = '{:.6f}-{}-{}.prof'.format(time.time(), view, os.getpid())
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.directory, name))
+
+        profiles = sorted(entry for entry in os.listdir(self.directory) if entry.endswith('.prof'))
+        for old in profiles[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                # файл уже удален другим воркером
+                pass
+        return name
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from rest_framework.authtoken.models import Token
+
+PROVISION_CHUNK_SIZE = getattr(settings, 'POLLS_PROVISION_CHUNK_SIZE', 1000)
+PROVISION_PROCESSES = getattr(settings, 'POLLS_PROVISION_PROCESSES', None) or os.cpu_count()
+# число пользователей в одном запросе API: пароли хешируются в процессе воркера
+BULK_PROVISION_MAX_SIZE = getattr(settings, 'POLLS_BULK_PROVISION_MAX_SIZE', 100)
+
+username_validator = UnicodeUsernameValidator()
+
+
+def provision_users(records, chunk_size=PROVISION_CHUNK_SIZE, processes=None):
+    """
+    Создает пользователей и их токены порциями по chunk_size.
+    records: итерируемое из пар (username, password). Пароли хешируются
+    в пуле из processes процессов (команда provision_users) или, если processes
+    не задано, в текущем процессе; пользователи и токены записываются
+    двумя bulk_create на порцию. Возвращает генератор словарей
+    с username и user_id и token, либо с username и error
+    """
+    records = iter(records)
+    if not processes:
+        yield from _provision(records, chunk_size,
+                              lambda passwords: [make_password(password) for password in passwords])
+        return
+    # spawn, а не fork: fork многопоточного процесса может унаследовать захваченные
+    # блокировки. Новый процесс настраивает Django заново
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=django.setup) as pool:
+        yield from _provision(records, chunk_size, lambda passwords: pool.map(
+            make_password, passwords, chunksize=max(1, len(passwords) // (4 * processes))))
+
+
+def _provision(records, chunk_size, hash_passwords):
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield from _provision_chunk(chunk, hash_passwords)
+
+
+def _provision_chunk(chunk, hash_passwords):
+    results = []
+    accepted = {}
+    for username, password in chunk:
+        error = _check(username, password)
+        if error is None and username in accepted:
+            error = 'duplicate username'
+        if error is not None:
+            results.append({'username': username, 'error': error})
+        else:
+            accepted[username] = password
+
+    for username in _existing_usernames(list(accepted)):
+        results.append({'username': username, 'error': 'already exists'})
+        del accepted[username]
+
+    usernames = list(accepted)
+    hashes = hash_passwords([accepted[username] for username in usernames])
+    users = [User(username=username, password=password_hash)
+             for username, password_hash in zip(usernames, hashes)]
+
+    try:
+        with transaction.atomic():
+            created = _insert_users(users)
+    except IntegrityError:
+        # имя заняла параллельная регистрация после проверки: порция
+        # записывается по одному пользователю, токен создает сигнал post_save
+        created = []
+        for user in users:
+            try:
+                with transaction.atomic():
+                    user.pk = None
+                    user.save()
+                created.append((user, user.auth_token))
+            except IntegrityError:
+                results.append({'username': user.username, 'error': 'already exists'})
+
+    results.extend({'username': user.username, 'user_id': user.pk, 'token': token.key}
+                   for user, token in created)
+    return results
+
+
+def _existing_usernames(usernames):
+    return set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+
+def _insert_users(users):
+    """
+    Записывает пользователей и их токены двумя bulk_create,
+    возвращает пары (пользователь, токен)
+    """
+    # bulk_create не отправляет post_save, поэтому токены создаются здесь же
+    User.objects.bulk_create(users)
+    if not connection.features.can_return_ids_from_bulk_insert:
+        # БД не возвращает первичные ключи после вставки (SQLite)
+        ids = dict(User.objects.filter(
+            username__in=[user.username for user in users]).values_list('username', 'id'))
+        for user in users:
+            user.pk = ids[user.username]
+    tokens = [Token(user_id=user.pk) for user in users]
+    for token in tokens:
+        token.key = token.generate_key()
+    Token.objects.bulk_create(tokens)
+    return list(zip(users, tokens))
+
+
+def _check(username, password):
+    if not isinstance(username, str) or not username or len(username) > 150:
+        return 'invalid username'
+    try:
+        username_validator(username)
+    except ValidationError:
+        return 'invalid username'
+    if not isinstance(password, str) or not password:
+        return 'invalid password'
+    return None
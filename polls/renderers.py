@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from rest_framework.renderers import JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, кодирующий ответы без отступов одним общим кодировщиком
+    вместо создания нового на каждый ответ. Вывод побайтно совпадает с JSONRenderer
+    """
+    encoder = JSONRenderer.encoder_class(
+        ensure_ascii=JSONRenderer.ensure_ascii,
+        allow_nan=not JSONRenderer.strict,
+        separators=(',', ':') if JSONRenderer.compact else (', ', ': '))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        ret = self.encoder.encode(data)
+        if '\u2028' in ret or '\u2029' in ret:
+            ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode('utf-8')
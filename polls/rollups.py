@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import HourVoteRollup, MinuteVoteRollup, Vote, Watermark
+from .tallies import increment_counter
+
+ROLLUP_WATERMARK = 'vote_rollups'
+
+# голоса, записанные позже этого интервала назад, не обрабатываются: транзакция
+# с меньшим id могла еще не зафиксироваться, и после сдвига отметки такой голос
+# был бы пропущен. Проверяется время записи, а не голосования: голоса из очереди
+# и импорта записываются с прежним created
+ROLLUP_GRACE = timedelta(seconds=getattr(settings, 'POLLS_ROLLUP_GRACE', 5))
+
+ROLLUP_BATCH_SIZE = getattr(settings, 'POLLS_ROLLUP_BATCH_SIZE', 5000)
+
+BUCKETS = {
+    'minute': (MinuteVoteRollup, timedelta(minutes=1)),
+    'hour': (HourVoteRollup, timedelta(hours=1)),
+}
+
+
+def truncate(moment, bucket):
+    """
+    Возвращает начало интервала bucket, в который попадает moment
+    """
+    if bucket == 'minute':
+        return moment.replace(second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def compact_rollups(batch_size=ROLLUP_BATCH_SIZE, grace=ROLLUP_GRACE):
+    """
+    Добавляет в поминутные и почасовые сводки голоса, записанные после
+    сохраненной отметки, порциями по batch_size. Каждая порция обрабатывается
+    в одной транзакции вместе со сдвигом отметки. Возвращает число учтенных голосов
+    """
+    processed = 0
+    while True:
+        count = _compact_batch(batch_size, now() - grace)
+        processed += count
+        if count < batch_size:
+            return processed
+
+
+def _compact_batch(batch_size, cutoff):
+    with transaction.atomic():
+        watermark, _ = Watermark.objects.get_or_create(name=ROLLUP_WATERMARK)
+        watermark = Watermark.objects.select_for_update().get(pk=watermark.pk)
+        votes = list(Vote.objects.filter(id__gt=watermark.position).values_list(
+            'id', 'question', 'answer', 'created', 'recorded').order_by('id')[:batch_size])
+
+        per_bucket = {bucket: Counter() for bucket in BUCKETS}
+        last_id = watermark.position
+        processed = 0
+        for vote_id, question_id, answer_id, created, recorded in votes:
+            if recorded is not None and recorded >= cutoff:
+                break
+            # голоса без времени сдвигают отметку, но в сводки не попадают
+            if created is not None:
+                for bucket in BUCKETS:
+                    per_bucket[bucket][(question_id, answer_id, truncate(created, bucket))] += 1
+            last_id = vote_id
+            processed += 1
+
+        for bucket, counts in per_bucket.items():
+            model = BUCKETS[bucket][0]
+            for (question_id, answer_id, start), count in sorted(counts.items(),
+                                                                 key=lambda item: item[0][1:]):
+                increment_counter(model, 'count', count, answer_id=answer_id, bucket=start,
+                                  defaults={'question_id': question_id})
+        if last_id != watermark.position:
+            Watermark.objects.filter(pk=watermark.pk).update(position=last_id)
+    return processed
+
+
+def get_timeseries(question_id, bucket, start, end):
+    """
+    Возвращает ряды числа голосов по вариантам ответа опроса
+    в интервалах bucket от start (включительно) до end (не включительно)
+    """
+    model = BUCKETS[bucket][0]
+    return model.objects.filter(
+        question_id=question_id,
+        bucket__gte=truncate(start, bucket),
+        bucket__lt=end
+    ).values_list('bucket', 'answer', 'count').order_by('bucket', 'answer')
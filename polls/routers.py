@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+from contextlib import contextmanager
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY_PIN_KEY = 'polls:primary_pin:{}'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# значение, которым сброс заменяет запись кэша: реплика может еще не содержать
+# изменение, поэтому следующее заполнение записи читает из основной БД
+INVALIDATED = 'polls:invalidated'
+
+_state = threading.local()
+
+
+def replicas():
+    """
+    Псевдонимы БД реплик из POLLS_DATABASE_REPLICAS
+    """
+    return getattr(settings, 'POLLS_DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter(object):
+    """
+    Направляет чтение в безопасных запросах на случайную реплику, все остальное
+    (запись, изменяющие запросы, команды) - в основную БД, в том числе для
+    объектов, прочитанных с реплики
+    """
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if aliases and getattr(_state, 'use_replica', False):
+            return random.choice(aliases)
+        return self._from_replica(aliases, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._from_replica(replicas(), hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная БД
+        databases = {DEFAULT_DB_ALIAS}.union(replicas())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def _from_replica(self, aliases, hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in aliases:
+            return DEFAULT_DB_ALIAS
+        return None
+
+
+@contextmanager
+def primary_reads(force=True):
+    """
+    Направляет чтение внутри блока в основную БД, если force
+    """
+    use_replica = getattr(_state, 'use_replica', False)
+    if force:
+        _state.use_replica = False
+    try:
+        yield
+    finally:
+        _state.use_replica = use_replica
+
+
+def invalidate_cache(keys):
+    """
+    Сбрасывает записи кэша так, чтобы в течение POLLS_REPLICA_PIN_SECONDS
+    они заполнялись чтением из основной БД, а не с отстающей реплики
+    """
+    cache.set_many({key: INVALIDATED for key in keys},
+                   getattr(settings, 'POLLS_REPLICA_PIN_SECONDS', 5))
+
+
+def credential_pin_key(credential):
+    return PRIMARY_PIN_KEY.format(sha256(credential.encode()).hexdigest())
+
+
+def pin_key(request):
+    """
+    Ключ закрепления клиента за основной БД: хеш заголовка Authorization
+    или cookie сессии, None для анонимных запросов
+    """
+    credential = (request.META.get('HTTP_AUTHORIZATION') or
+                  request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credential:
+        return None
+    return credential_pin_key(credential)
+
+
+def issued_pin_keys(response):
+    """
+    Ключи закрепления для учетных данных, выданных в ответе: токена
+    регистрации или входа и новой cookie сессии
+    """
+    credentials = []
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and data.get('token'):
+        credentials.append('Token {}'.format(data['token']))
+    session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+    if session is not None and session.value:
+        credentials.append(session.value)
+    return [credential_pin_key(credential) for credential in credentials]
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Разрешает чтение с реплик в безопасных запросах. После изменяющего запроса
+    клиент на POLLS_REPLICA_PIN_SECONDS закрепляется за основной БД, чтобы
+    видеть свои изменения несмотря на отставание реплик, вместе с выданными
+    в ответе токеном или сессией, которых на реплике еще нет. Закрепление хранится
+    в кэше, поэтому между воркерами работает только с общим для них кэшем
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas():
+            return self.get_response(request)
+
+        key = pin_key(request)
+        safe = request.method in SAFE_METHODS
+        use_replica = safe and (key is None or cache.get(key) is None)
+        _state.use_replica = use_replica
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.use_replica = False
+        if use_replica and response.streaming:
+            response.streaming_content = self.stream(response.streaming_content)
+        if not safe:
+            keys = issued_pin_keys(response)
+            if key is not None:
+                keys.append(key)
+            cache.set_many(dict.fromkeys(keys, True),
+                           getattr(settings, 'POLLS_REPLICA_PIN_SECONDS', 5))
+        return response
+
+    def stream(self, content):
+        # потоковые выгрузки читают БД уже после выхода из middleware
+        iterator = iter(content)
+        while True:
+            _state.use_replica = True
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _state.use_replica = False
+            yield chunk
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
 from decimal import Decimal
 
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
 from django.utils.timezone import localtime, now
 from rest_framework import serializers
-from .models import Answer, Question, Vote
+from rest_framework.settings import api_settings
+from .feed import FEED_BATCH_SIZE
+from .models import Answer, PendingVote, Question, Vote
+from .rollups import BUCKETS
 
 
 class UserSerialization(serializers.ModelSerializer):
@@ -15,12 +21,11 @@ class UserSerialization(serializers.ModelSerializer):
     Сериализатор модели User для регистрации пользователей
     """
     def create(self, validated_data):
-        user = User.objects.create(
-            username=validated_data['username']
+        # пароль хешируется до вставки, поэтому пользователь записывается одним INSERT
+        return User.objects.create_user(
+            username=validated_data['username'],
+            password=validated_data['password']
         )
-        user.set_password(validated_data['password'])
-        user.save()
-        return user
 
     class Meta:
         model = User
@@ -44,48 +49,91 @@ class VoteSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели Vote
     """
+    # идентификаторы принимаются как есть, чтобы не загружать объекты отдельными запросами
+    question = serializers.IntegerField(source='question_id', read_only=True)
+    answer = serializers.IntegerField(source='answer_id')
+
     def validate(self, attrs):
         validated = super(VoteSerializer, self).validate(attrs)
-        answer = validated['answer']
-        question = self.context['question']
-        # проверяем принадлежит ли ответ опросу
-        if answer not in question.answer_set.all():
+        # одним запросом проверяем принадлежность ответа опросу, получаем даты опроса
+        # и наличие голоса пользователя
+        user = self.context['request'].user
+        row = Answer.objects.filter(
+            pk=validated['answer_id'],
+            question_id=self.context['question_id']
+        ).annotate(
+            voted=Exists(Vote.objects.filter(user=user, question_id=OuterRef('question_id')))
+        ).values_list('question__date_start', 'question__date_end', 'voted').first()
+        if row is None:
             raise serializers.ValidationError('Answer is not valid')
 
         # проверяем акивен ли опрос по датам начала и конца
         current_time = localtime(now())
-        if answer.question.date_start > current_time or \
-                        answer.question.date_end < current_time:
+        date_start, date_end, voted = row
+        if date_start > current_time or date_end < current_time:
             raise serializers.ValidationError('Question is not active')
 
-        user = self.context['request'].user
-        queryset = Vote.objects.filter(user=user,
-                                       answer__question=answer.question)
-
-        # в случае если пользователь уже голосовал вызываем исключение
-        if queryset.exists():
+        # окончательно повторное голосование отсекается ограничением уникальности в create
+        if voted:
             raise serializers.ValidationError('Already voted')
 
         return validated
 
+    def create(self, validated_data):
+        # повторное голосование отсекается уникальным ограничением (user, question)
+        try:
+            with transaction.atomic():
+                return self.Meta.model.objects.create(**validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['Already voted']})
+
     class Meta:
         model = Vote
         fields = ('question', 'answer')
-        extra_kwargs = {
-            'question': {'required': False}
-        }
 
 
-class QuestionListSerializer(serializers.ModelSerializer):
+class BallotItemSerializer(serializers.Serializer):
+    """
+    Пара опрос и вариант ответа в бюллетене. Ответ проверяется в cast_ballot
+    """
+    question = serializers.IntegerField()
+    answer = serializers.IntegerField()
+
+
+class PendingVoteSerializer(VoteSerializer):
+    """
+    Сериализатор голоса, поставленного в очередь на запись
+    """
+    class Meta(VoteSerializer.Meta):
+        model = PendingVote
+
+
+class UserVoteMixin(serializers.Serializer):
+    """
+    Поля voted и my_answer по голосам пользователя из контекста:
+    votes - {question_id: answer_id}
+    """
+    voted = serializers.SerializerMethodField()
+    my_answer = serializers.SerializerMethodField()
+
+    def get_voted(self, question):
+        return question.id in self.context.get('votes', {})
+
+    def get_my_answer(self, question):
+        return self.context.get('votes', {}).get(question.id)
+
+
+class QuestionListSerializer(UserVoteMixin, serializers.ModelSerializer):
     """
     Сериализатор списка вопросов
     """
     class Meta:
         model = Question
-        fields = ('id', 'title', 'pub_date')
+        fields = ('id', 'title', 'pub_date', 'voted', 'my_answer')
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(UserVoteMixin, serializers.ModelSerializer):
     """
     Сериализатор модели Question
     """
@@ -97,7 +145,9 @@ class QuestionSerializer(serializers.ModelSerializer):
                   'text',
                   'date_start',
                   'date_end',
-                  'answer_set')
+                  'answer_set',
+                  'voted',
+                  'my_answer')
 
 
 class StatisticSerializer(serializers.Serializer):
@@ -114,3 +164,59 @@ class StatisticSerializer(serializers.Serializer):
     def get_frequency(self, obj):
         frequency = obj.get('per_answer') / obj.get('total')
         return round(Decimal(frequency), 2)
+
+
+class TimeSeriesQuerySerializer(serializers.Serializer):
+    """
+    Сериализатор параметров запроса временного ряда голосов
+    """
+    # интервал по умолчанию и наибольшее число точек ряда
+    DEFAULT_SPANS = {'minute': timedelta(hours=1), 'hour': timedelta(days=1)}
+    MAX_POINTS = 10000
+
+    bucket = serializers.ChoiceField(choices=sorted(BUCKETS), default='hour')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        attrs = super(TimeSeriesQuerySerializer, self).validate(attrs)
+        attrs.setdefault('end', localtime(now()))
+        attrs.setdefault('start', attrs['end'] - self.DEFAULT_SPANS[attrs['bucket']])
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError('start must be earlier than end')
+        if (attrs['end'] - attrs['start']) / BUCKETS[attrs['bucket']][1] > self.MAX_POINTS:
+            raise serializers.ValidationError('Range is too large')
+        return attrs
+
+
+class TimeSeriesSerializer(serializers.Serializer):
+    """
+    Сериализатор точки временного ряда голосов
+    """
+    bucket = serializers.DateTimeField()
+    answer = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+
+class FeedQuerySerializer(serializers.Serializer):
+    """
+    Сериализатор параметров запроса ленты голосов
+    """
+    MAX_LIMIT = 10000
+    # ожидание должно укладываться в таймаут воркера gunicorn (30 секунд)
+    MAX_WAIT = 25
+
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT, default=FEED_BATCH_SIZE)
+    wait = serializers.FloatField(min_value=0, max_value=MAX_WAIT, default=0)
+
+
+class FeedVoteSerializer(serializers.Serializer):
+    """
+    Сериализатор голоса в ленте
+    """
+    id = serializers.IntegerField()
+    question = serializers.IntegerField()
+    answer = serializers.IntegerField()
+    user = serializers.IntegerField()
+    created = serializers.DateTimeField()
@@ -1,12 +1,84 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils.timezone import now
 from rest_framework.authtoken.models import Token
 
+from .authentication import token_cache
+from .caching import invalidate_active_questions
+from .models import Answer, Question, QuestionTally, VoteTally
+from .permissions import invalidate_user_groups
+
 
 # Генерируем и сохраняем в БД токен при регистрации пользователя
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+
+# Заводим нулевые счетчики голосов, чтобы при голосовании достаточно было UPDATE
+@receiver(post_save, sender=Question)
+def create_question_tally(sender, instance=None, created=False, **kwargs):
+    if created:
+        QuestionTally.objects.create(question=instance)
+
+
+@receiver(post_save, sender=Answer)
+def create_answer_tally(sender, instance=None, created=False, **kwargs):
+    if created:
+        VoteTally.objects.create(question_id=instance.question_id, answer=instance)
+
+
+# Изменение вариантов ответа меняет время изменения опроса, по которому строится ETag
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def touch_question(sender, instance=None, **kwargs):
+    Question.objects.filter(pk=instance.question_id).update(modified=now())
+
+
+# Изменение опросов и вариантов ответа сбрасывает кэш активных опросов
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def reset_active_questions(sender, **kwargs):
+    invalidate_active_questions()
+
+
+# Удаление или перевыпуск токена и изменение пользователя сбрасывают кэш аутентификации
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance=None, **kwargs):
+    token_cache.discard(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_user_tokens(sender, instance=None, created=False, **kwargs):
+    if not created:
+        token_cache.discard_user(instance.pk)
+
+
+# Изменение членства в группах, переименование и удаление групп сбрасывают кэш групп,
+# изменение членства сбрасывает и кэш аутентификации участников
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_user_groups(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True))
+    else:
+        user_ids = list(pk_set or ())
+    invalidate_user_groups(user_ids)
+    for user_id in user_ids:
+        token_cache.discard_user(user_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def reset_group_members(sender, instance=None, created=False, **kwargs):
+    if not created:
+        invalidate_user_groups(instance.user_set.values_list('pk', flat=True))
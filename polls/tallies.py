@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import (Answer,
+                     AnswerSnapshot,
+                     ArchivedVote,
+                     Question,
+                     QuestionSnapshot,
+                     QuestionTally,
+                     Vote,
+                     VoteTally)
+
+
+def record_votes(pairs):
+    """
+    Увеличивает счетчики голосов, pairs: итерируемое из пар (question_id, answer_id).
+    Должна вызываться в той же транзакции, что и запись самих голосов
+    """
+    per_answer = Counter(pairs)
+    per_question = Counter()
+    for (question_id, _), count in per_answer.items():
+        per_question[question_id] += count
+
+    # блокируем строки в одном и том же порядке, чтобы избежать взаимоблокировок
+    for (question_id, answer_id), count in sorted(per_answer.items(), key=lambda item: item[0][1]):
+        increment_counter(VoteTally, 'count', count,
+                          answer_id=answer_id, defaults={'question_id': question_id})
+    for question_id, count in sorted(per_question.items()):
+        increment_counter(QuestionTally, 'total', count, question_id=question_id)
+
+
+def increment_counter(model, field, count, defaults=None, **lookup):
+    """
+    Атомарно прибавляет count к полю счетчика, создавая строку при необходимости
+    """
+    queryset = model.objects.filter(**lookup)
+    if queryset.update(**{field: F(field) + count}):
+        return
+    values = dict(defaults or {}, **{field: count})
+    _, created = model.objects.get_or_create(defaults=values, **lookup)
+    if not created:
+        queryset.update(**{field: F(field) + count})
+
+
+def count_votes(archived=False):
+    """
+    Подсчитывает голоса по исходным таблицам, возвращает пару словарей
+    {answer_id: count} и {question_id: total}. По умолчанию считаются голоса
+    опросов со счетчиками, archived=True - архивированных опросов,
+    включая перенесенные в ArchivedVote
+    """
+    per_answer = Counter()
+    per_question = Counter()
+    for model in (Vote, ArchivedVote) if archived else (Vote,):
+        rows = model.objects.filter(question__snapshot__isnull=not archived).values(
+            'question', 'answer').annotate(count=Count('id')).values_list(
+            'question', 'answer', 'count').order_by()
+        for question_id, answer_id, count in rows:
+            per_answer[answer_id] += count
+            per_question[question_id] += count
+    return per_answer, per_question
+
+
+def verify_tallies():
+    """
+    Сравнивает счетчики и итоги архивированных опросов с исходными голосами,
+    возвращает список расхождений (вид, id объекта, сохраненное значение,
+    фактическое значение)
+    """
+    live = {'question__snapshot__isnull': True}
+    mismatches = _compare(
+        count_votes(),
+        dict(VoteTally.objects.filter(**live).values_list('answer', 'count')),
+        dict(QuestionTally.objects.filter(**live).values_list('question', 'total')),
+        Answer.objects.filter(**live), Question.objects.filter(snapshot__isnull=True), '')
+
+    archived = {'question__snapshot__isnull': False}
+    mismatches.extend(_compare(
+        count_votes(archived=True),
+        dict(AnswerSnapshot.objects.values_list('answer', 'count')),
+        dict(QuestionSnapshot.objects.values_list('question', 'total')),
+        Answer.objects.filter(**archived), Question.objects.filter(snapshot__isnull=False),
+        ' snapshot'))
+    return mismatches
+
+
+def _compare(actual, stored, stored_totals, answers, questions, suffix):
+    actual, actual_totals = actual
+    mismatches = []
+    for answer_id in answers.values_list('id', flat=True).order_by('id'):
+        expected = actual.get(answer_id, 0)
+        if stored.get(answer_id, 0) != expected:
+            mismatches.append(('answer' + suffix, answer_id, stored.get(answer_id), expected))
+    for question_id in questions.values_list('id', flat=True).order_by('id'):
+        expected = actual_totals.get(question_id, 0)
+        if stored_totals.get(question_id, 0) != expected:
+            mismatches.append(('question' + suffix, question_id,
+                               stored_totals.get(question_id), expected))
+    return mismatches
+
+
+def rebuild_tallies():
+    """
+    Пересчитывает счетчики по исходным голосам, возвращает число исправленных строк.
+    Итоги архивированных опросов не изменяются, их счетчики удаляются
+    """
+    with transaction.atomic():
+        # блокируем счетчики до подсчета, чтобы голоса, записываемые параллельно,
+        # либо попали в подсчет, либо увеличили счетчик уже после пересчета
+        list(VoteTally.objects.select_for_update().values_list('pk', flat=True))
+        list(QuestionTally.objects.select_for_update().values_list('pk', flat=True))
+
+        fixed = VoteTally.objects.filter(question__snapshot__isnull=False).delete()[0]
+        fixed += QuestionTally.objects.filter(question__snapshot__isnull=False).delete()[0]
+
+        actual, actual_totals = count_votes()
+        stored = dict(VoteTally.objects.values_list('answer', 'count'))
+        missing = []
+        for answer_id, question_id in Answer.objects.filter(
+                question__snapshot__isnull=True).values_list('id', 'question'):
+            expected = actual.get(answer_id, 0)
+            if answer_id not in stored:
+                missing.append(VoteTally(question_id=question_id, answer_id=answer_id, count=expected))
+            elif stored[answer_id] != expected:
+                VoteTally.objects.filter(answer_id=answer_id).update(count=expected)
+                fixed += 1
+        VoteTally.objects.bulk_create(missing)
+        fixed += len(missing)
+
+        stored_totals = dict(QuestionTally.objects.values_list('question', 'total'))
+        missing = []
+        for question_id in Question.objects.filter(
+                snapshot__isnull=True).values_list('id', flat=True):
+            expected = actual_totals.get(question_id, 0)
+            if question_id not in stored_totals:
+                missing.append(QuestionTally(question_id=question_id, total=expected))
+            elif stored_totals[question_id] != expected:
+                QuestionTally.objects.filter(question_id=question_id).update(total=expected)
+                fixed += 1
+        QuestionTally.objects.bulk_create(missing)
+        fixed += len(missing)
+    return fixed
@@ -1,10 +1,46 @@
 # -*- coding: utf-8 -*-
-from django.contrib.auth.models import User
+import json
+import multiprocessing
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError
 from django.utils.timezone import localtime, now, timedelta
+from django.db import connection
+from django.db.models import F
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
-from .models import Question, Answer
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+from .admin import EstimatedCountPaginator, estimated_count
+from .authentication import CachedTokenAuthentication, token_cache
+from .benchmarks import benchmark_caches, benchmark_serializers, build_scenarios
+from .budgets import QUERY_BUDGETS, QueryBudgetExceeded, query_budget
+from .caching import get_active_questions
+from .live import broker
+from .metrics import EXITED_FILE, clear_metrics_dir, registry, retire_worker
+from .mmapcache import MmapCache
+from .profiling import ProfilingMiddleware
+from .provisioning import BULK_PROVISION_MAX_SIZE, provision_users
+from .routers import credential_pin_key
+from .ingestion import create_votes, vote_status
+from .models import (Question, Answer, AnswerSnapshot, ArchivedVote, PendingVote, Vote,
+                     VoteTally, QuestionTally)
+from .pagination import KeysetPagination
+from .permissions import ClientPermission
+from .serializers import QuestionSerializer, QuestionListSerializer, StatisticSerializer
 
 
 def create_account(superuser=False):
@@ -72,6 +108,87 @@ class RegisterUserTest(APITestCase):
         self.assertEqual(User.objects.count(), 1)
         self.assertEqual(User.objects.get().username, 'test_account')
 
+    def test_register_user_single_insert(self):
+        """
+        проверяет что регистрация записывает пользователя одним INSERT (и токен сигналом)
+        """
+        url = reverse('polls:sign-on')
+        data = {'username': 'test_account',
+                'password': 'pass12345'}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, data=data)
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(User.objects.get().check_password('pass12345'))
+
+
+class BulkProvisionTest(APITestCase):
+    def test_bulk_provision(self):
+        """
+        проверяет массовую регистрацию пользователей администратором
+        """
+        User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get().key)
+        data = [{'username': 'user{}'.format(i), 'password': 'pass12345'} for i in range(3)]
+        data.append({'username': 'admin', 'password': 'pass12345'})
+        response = self.client.post(reverse('polls:bulk_provision'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['error'] for row in rows if 'error' in row], ['already exists'])
+        for row in rows:
+            if 'token' in row:
+                self.assertEqual(Token.objects.get(key=row['token']).user.username, row['username'])
+        self.assertTrue(User.objects.get(username='user1').check_password('pass12345'))
+
+    def test_bulk_provision_concurrent_registration(self):
+        """
+        проверяет, что имя, занятое после проверки существующих пользователей,
+        возвращается ошибкой строки, а остальные пользователи порции создаются
+        """
+        User.objects.create(username='taken')
+        records = [('taken', 'pass12345'), ('free', 'pass12345')]
+        with mock.patch('polls.provisioning._existing_usernames', return_value=set()):
+            rows = list(provision_users(records))
+        self.assertEqual([row.get('error') for row in rows], ['already exists', None])
+        self.assertEqual(Token.objects.get(key=rows[1]['token']).user.username, 'free')
+
+    def test_bulk_provision_forbidden(self):
+        """
+        проверяет недоступность массовой регистрации обычным пользователям
+        """
+        token = create_account()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.post(reverse('polls:bulk_provision'), data=[], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_provision_too_large(self):
+        """
+        проверяет отказ для списка больше BULK_PROVISION_MAX_SIZE
+        """
+        User.objects.create(username='admin', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get().key)
+        data = [{'username': 'user{}'.format(i), 'password': 'pass12345'}
+                for i in range(BULK_PROVISION_MAX_SIZE + 1)]
+        response = self.client.post(reverse('polls:bulk_provision'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_provision_users_command(self):
+        """
+        проверяет массовую регистрацию пользователей командой provision_users
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'users.csv')
+        with open(path, 'w') as source:
+            source.write('username,password\npanel1,pass12345\npanel2,pass12345\n')
+        output = StringIO()
+        call_command('provision_users', path, processes=2, stdout=output)
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['panel1', 'panel2'])
+        self.assertEqual(Token.objects.count(), 2)
+
 
 class GetTokenTest(APITestCase):
     def test_get_token(self):
@@ -122,6 +239,243 @@ class QuestionDetailsTest(APITestCase):
         self.assertEqual(response.content, b'{"detail":"Not found."}')
 
 
+class ActiveQuestionsCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_question_list(self):
+        """
+        проверяет что повторный запрос списка опросов не обращается к опросам в БД,
+        а изменение опросов сбрасывает кэш
+        """
+        token = create_account()
+        create_question(-1)
+        url = reverse('polls:questions')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+        # токен уже в кэше аутентификации, читаются только голоса пользователя
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        create_question(-1)
+        self.assertEqual(len(self.client.get(url).data['results']), 2)
+
+    def test_cache_expires_at_boundary(self):
+        """
+        проверяет что кэш активных опросов действует до ближайшего начала или окончания опроса
+        """
+        create_account()
+        question_id, _ = create_question(-4.5)
+        current = localtime(now())
+        question = Question.objects.get()
+        entry = get_active_questions(current)
+        self.assertIn(question_id, entry['index'])
+        self.assertEqual(entry['valid_until'], question.date_end)
+        entry = get_active_questions(question.date_end)
+        self.assertNotIn(question_id, entry['index'])
+
+
+class PaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+
+    def walk(self, url):
+        """
+        обходит все страницы вперед, затем назад, возвращает ключи записей
+        """
+        forward, backward = [], []
+        response = self.client.get(url, data={'page_size': 2})
+        while True:
+            forward.append([item['id'] for item in response.data['results']])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            backward.insert(0, [item['id'] for item in response.data['results']])
+        return forward, backward
+
+    def test_question_pages(self):
+        """
+        проверяет постраничный вывод опросов вперед и назад по курсору
+        """
+        ids = [create_question(-1)[0] for _ in range(5)]
+        forward, backward = self.walk(reverse('polls:questions'))
+        self.assertEqual(forward, [ids[0:2], ids[2:4], ids[4:]])
+        self.assertEqual(backward, forward[:-1])
+
+    def test_statistic_pages(self):
+        """
+        проверяет постраничный вывод статистики и то, что новые записи
+        не сдвигают уже выданные страницы
+        """
+        question_ids = []
+        for _ in range(3):
+            question_id, answer_id = create_question(-1)
+            question_ids.append(question_id)
+            self.client.post(reverse('polls:vote', kwargs={'pk': question_id}),
+                             data={'answer': answer_id})
+        response = self.client.get(reverse('polls:statistics'), data={'page_size': 2})
+        self.assertEqual([item['question'] for item in response.data['results']], question_ids[:2])
+        Answer.objects.create(question_id=question_ids[0], answer_text='text')
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['question'] for item in response.data['results']], question_ids[2:])
+        self.assertIsNone(response.data['next'])
+
+    def test_pagination_disabled(self):
+        """
+        проверяет вывод без постраничного разбиения при пустом POLLS_PAGE_SIZE
+        """
+        question_ids = []
+        for _ in range(3):
+            question_id, answer_id = create_question(-1)
+            question_ids.append(question_id)
+            self.client.post(reverse('polls:vote', kwargs={'pk': question_id}),
+                             data={'answer': answer_id})
+        with mock.patch.object(KeysetPagination, 'page_size', None):
+            response = self.client.get(reverse('polls:questions'))
+            self.assertEqual([item['id'] for item in response.data], question_ids)
+            response = self.client.get(reverse('polls:statistics'))
+            self.assertEqual([item['question'] for item in response.data], question_ids)
+
+    def test_invalid_cursor(self):
+        """
+        проверяет ответ на некорректный курсор
+        """
+        response = self.client.get(reverse('polls:questions'), data={'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.question_id, self.answer_id = create_question(-1)
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        return etag
+
+    def test_question_list_not_modified(self):
+        """
+        проверяет ответ 304 для неизменившегося списка опросов и новый ETag после изменения
+        """
+        url = reverse('polls:questions')
+        etag = self.assertNotModified(url)
+        Answer.objects.create(question_id=self.question_id, answer_text='text')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # состав списка меняется по времени, поэтому Last-Modified не отправляется
+        self.assertNotIn('Last-Modified', response)
+
+    def test_question_details_not_modified(self):
+        """
+        проверяет ответ 304 для неизменившегося опроса
+        """
+        url = reverse('polls:question_details', kwargs={'pk': self.question_id})
+        self.assertNotModified(url)
+
+    def test_vote_state(self):
+        """
+        проверяет поля voted и my_answer и смену ETag опроса после голосования
+        """
+        list_url = reverse('polls:questions')
+        url = reverse('polls:question_details', kwargs={'pk': self.question_id})
+        etag = self.assertNotModified(url)
+        self.assertEqual(self.client.get(list_url).data['results'][0]['voted'], False)
+        self.client.post(reverse('polls:vote', kwargs={'pk': self.question_id}),
+                         data={'answer': self.answer_id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['voted'], response.data['my_answer']),
+                         (True, self.answer_id))
+        self.assertEqual(self.client.get(list_url).data['results'][0]['my_answer'], self.answer_id)
+
+    def test_statistic_not_modified(self):
+        """
+        проверяет что ETag статистики меняется после голосования
+        """
+        url = reverse('polls:statistics')
+        etag = self.assertNotModified(url)
+        self.client.post(reverse('polls:vote', kwargs={'pk': self.question_id}),
+                         data={'answer': self.answer_id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TokenCacheTest(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+
+    def test_cached_token(self):
+        """
+        проверяет что повторная аутентификация по токену не обращается к БД
+        """
+        token = create_account()
+        url = reverse('polls:questions')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_cached_user_not_shared(self):
+        """
+        проверяет что каждый запрос получает свой экземпляр пользователя
+        """
+        token = create_account()
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(token)
+        first.request_attribute = True
+        with self.assertNumQueries(0):
+            second, second_token = authentication.authenticate_credentials(token)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.pk, second.pk)
+        self.assertFalse(hasattr(second, 'request_attribute'))
+        self.assertIs(second_token.user, second)
+
+    def test_group_change(self):
+        """
+        проверяет сброс кэша при изменении групп пользователя
+        """
+        token = create_account()
+        CachedTokenAuthentication().authenticate_credentials(token)
+        User.objects.get().groups.add(Group.objects.create(name='Clients'))
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_deleted_token(self):
+        """
+        проверяет сброс кэша при удалении токена
+        """
+        token = create_account()
+        url = reverse('polls:questions')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.get(url)
+        Token.objects.all().delete()
+        self.assertEqual(token_cache.stats()['size'], 0)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user(self):
+        """
+        проверяет сброс кэша при деактивации пользователя
+        """
+        token = create_account()
+        url = reverse('polls:questions')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.get(url)
+        user = User.objects.get()
+        user.is_active = False
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
 class VoteTest(APITestCase):
     def test_not_authenticated_question_vote(self):
         """
@@ -160,6 +514,35 @@ class VoteTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn(b'["Question is not active"]', response.content)
 
+    def test_authenticated_question_vote_twice(self):
+        """
+        проверяет что повторное голосование отклоняется ограничением уникальности
+        """
+        token = create_account()
+        question_id, answer_id = create_question(0)
+        url = reverse('polls:vote', kwargs={'pk': question_id})
+        data = {"answer": answer_id}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.post(url, data=data)
+        response = self.client.post(url, data=data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(b'["Already voted"]', response.content)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(VoteTally.objects.get(answer_id=answer_id).count, 1)
+
+    def test_authenticated_wrong_answer_vote(self):
+        """
+        проверяет голосование ответом, не принадлежащим опросу
+        """
+        token = create_account()
+        question_id, _ = create_question(0)
+        _, other_answer_id = create_question(0)
+        url = reverse('polls:vote', kwargs={'pk': question_id})
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.post(url, data={"answer": other_answer_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(b'["Answer is not valid"]', response.content)
+
 
 class StatisticTest(APITestCase):
     def test_not_authenticated_statistic(self):
@@ -180,12 +563,890 @@ class StatisticTest(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    # def test_superuser_statistic(self):
-    #     """
-    #     проверяет доступность статистики для суперпользователей
-    #     """
-    #     token = create_account(True)
-    #     url = reverse('polls:statistics')
-    #     self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
-    #     response = self.client.get(url)
-    #     self.assertEqual(response.status_code, status.HTTP_200_OK)
+    def test_superuser_statistic(self):
+        """
+        проверяет доступность статистики для суперпользователей
+        """
+        token = create_account(True)
+        url = reverse('polls:statistics')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_statistic_after_vote(self):
+        """
+        проверяет что статистика строится по счетчикам, обновляемым при голосовании
+        """
+        token = create_account(True)
+        question_id, answer_id = create_question(0)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.post(reverse('polls:vote', kwargs={'pk': question_id}),
+                         data={'answer': answer_id})
+        response = self.client.get(reverse('polls:statistics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['answer'], answer_id)
+        self.assertEqual(results[0]['total'], 1)
+        self.assertEqual(results[0]['frequency'], 1)
+
+    def test_client_statistic(self):
+        """
+        проверяет доступность статистики после добавления пользователя в группу Clients
+        """
+        cache.clear()
+        token = create_account()
+        url = reverse('polls:statistics')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        group = Group.objects.create(name='Clients')
+        User.objects.get().groups.add(group)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        group.name = 'Former clients'
+        group.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_superuser_skips_groups(self):
+        """
+        проверяет что для суперпользователя членство в группах не запрашивается
+        """
+        user = User.objects.create(username='admin', is_superuser=True)
+        request = APIRequestFactory().get('/')
+        request.user = user
+        with self.assertNumQueries(0):
+            self.assertTrue(ClientPermission().has_permission(request, None))
+
+
+class TallyCommandTest(APITestCase):
+    def test_rebuild_tallies(self):
+        """
+        проверяет проверку и пересчет счетчиков голосов командой rebuild_tallies
+        """
+        create_account()
+        question_id, answer_id = create_question(0)
+        Vote.objects.create(user=User.objects.get(), question_id=question_id, answer_id=answer_id)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tallies', verify=True, stdout=StringIO())
+        call_command('rebuild_tallies', stdout=StringIO())
+        call_command('rebuild_tallies', verify=True, stdout=StringIO())
+        self.assertEqual(VoteTally.objects.get(answer_id=answer_id).count, 1)
+        self.assertEqual(QuestionTally.objects.get(question_id=question_id).total, 1)
+
+
+class ExportTest(APITestCase):
+    def setUp(self):
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.question_id, self.answer_id = create_question(-1)
+        self.client.post(reverse('polls:vote', kwargs={'pk': self.question_id}),
+                         data={'answer': self.answer_id})
+
+    def test_statistic_csv_export(self):
+        """
+        проверяет потоковую выгрузку статистики в CSV
+        """
+        response = self.client.get(reverse('polls:statistics_export', kwargs={'fmt': 'csv'}),
+                                   HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), [
+            'question,question__title,answer__answer_text,total,answer,frequency',
+            '{},test,text,1,{},1.00'.format(self.question_id, self.answer_id),
+        ])
+
+    def test_vote_ndjson_export(self):
+        """
+        проверяет потоковую выгрузку голосов в NDJSON и выгрузку командой export_data
+        """
+        response = self.client.get(reverse('polls:votes_export', kwargs={'fmt': 'ndjson'}))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        vote = Vote.objects.get()
+        self.assertEqual(rows, [{'id': vote.id, 'user': vote.user_id,
+                                 'question': self.question_id, 'answer': self.answer_id,
+                                 'created': vote.created.isoformat().replace('+00:00', 'Z')}])
+        output = StringIO()
+        call_command('export_data', 'votes', format='ndjson', stdout=output)
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], rows)
+
+    def test_not_client_export(self):
+        """
+        проверяет недоступность выгрузки для обычных пользователей
+        """
+        token = User.objects.create(username='user').auth_token.key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.get(reverse('polls:votes_export', kwargs={'fmt': 'csv'}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TimeSeriesTest(APITestCase):
+    def test_timeseries(self):
+        """
+        проверяет построение сводок по новым голосам и ряд голосов по опросу
+        """
+        token = create_account(True)
+        question_id, answer_id = create_question(-1)
+        start = localtime(now()).replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        user = User.objects.get()
+        other = User.objects.create(username='other')
+        Vote.objects.create(user=user, question_id=question_id, answer_id=answer_id,
+                            created=start + timedelta(minutes=1))
+        Vote.objects.create(user=other, question_id=question_id, answer_id=answer_id,
+                            created=start + timedelta(minutes=1, seconds=30))
+        call_command('compact_rollups', grace=0, stdout=StringIO())
+        # повторный запуск не учитывает уже обработанные голоса
+        call_command('compact_rollups', grace=0, stdout=StringIO())
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('polls:timeseries', kwargs={'pk': question_id})
+        response = self.client.get(url, data={'bucket': 'minute',
+                                              'start': start.isoformat(),
+                                              'end': (start + timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['series']), 1)
+        self.assertEqual(response.data['series'][0]['count'], 2)
+        self.assertEqual(response.data['series'][0]['answer'], answer_id)
+
+        response = self.client.get(url, data={'bucket': 'hour', 'start': start.isoformat()})
+        self.assertEqual([point['count'] for point in response.data['series']], [2])
+
+    def test_timeseries_range(self):
+        """
+        проверяет ограничение на число точек ряда
+        """
+        token = create_account(True)
+        question_id, _ = create_question(-1)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('polls:timeseries', kwargs={'pk': question_id})
+        response = self.client.get(url, data={'bucket': 'minute',
+                                              'start': '2000-01-01T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BallotTest(APITestCase):
+    def setUp(self):
+        token = create_account()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.url = reverse('polls:ballot')
+        self.questions = [create_question(-1) for _ in range(3)]
+
+    def test_partial_failure(self):
+        """
+        проверяет запись голосов бюллетеня и результат по каждому голосу
+        """
+        (first, first_answer), (second, second_answer), (third, _) = self.questions
+        closed, closed_answer = create_question(-10)
+        Vote.objects.create(user=User.objects.get(), question_id=third,
+                            answer_id=Answer.objects.get(question_id=third).id)
+        ballot = [
+            {'question': first, 'answer': first_answer},
+            {'question': second, 'answer': first_answer},
+            {'question': closed, 'answer': closed_answer},
+            {'question': third, 'answer': Answer.objects.get(question_id=third).id},
+            {'question': second, 'answer': second_answer},
+            {'question': second, 'answer': second_answer},
+        ]
+        # токен, проверка всех пар, вставка и по два счетчика на каждый из двух опросов
+        with query_budget('ballot', budget=7):
+            response = self.client.post(self.url, ballot, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(result['status'], result.get('error')) for result in response.data['results']], [
+            ('recorded', None),
+            ('rejected', 'Answer is not valid'),
+            ('rejected', 'Question is not active'),
+            ('rejected', 'Already voted'),
+            ('recorded', None),
+            ('rejected', 'Already voted'),
+        ])
+        self.assertEqual(Vote.objects.filter(question_id__in=(first, second)).count(), 2)
+        self.assertEqual(VoteTally.objects.get(answer_id=second_answer).count, 1)
+
+    def test_invalid_ballot(self):
+        """
+        проверяет отказ для бюллетеня неверного формата и пустого бюллетеня
+        """
+        response = self.client.post(self.url, [{'question': 'x'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Vote.objects.count(), 0)
+
+    @override_settings(POLLS_VOTE_INGESTION='buffered')
+    def test_buffered(self):
+        """
+        проверяет постановку голосов бюллетеня в очередь
+        """
+        ballot = [{'question': question_id, 'answer': answer_id}
+                  for question_id, answer_id in self.questions]
+        response = self.client.post(self.url, ballot + ballot[:1], format='json')
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['pending'] * 3 + ['rejected'])
+        self.assertEqual(PendingVote.objects.count(), 3)
+        call_command('drain_votes', stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 3)
+
+
+@override_settings(POLLS_VOTE_INGESTION='buffered')
+class BufferedVoteTest(APITestCase):
+    def setUp(self):
+        token = create_account()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.question_id, self.answer_id = create_question(0)
+        self.url = reverse('polls:vote', kwargs={'pk': self.question_id})
+        self.status_url = reverse('polls:vote_status', kwargs={'pk': self.question_id})
+
+    def test_buffered_vote(self):
+        """
+        проверяет постановку голоса в очередь, его запись командой drain_votes
+        и отказ при повторном голосовании
+        """
+        response = self.client.post(self.url, data={'answer': self.answer_id})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.client.get(self.status_url).data['status'], 'pending')
+        # голос из очереди виден в опросе до записи
+        details_url = reverse('polls:question_details', kwargs={'pk': self.question_id})
+        self.assertEqual(self.client.get(details_url).data['my_answer'], self.answer_id)
+        response = self.client.post(self.url, data={'answer': self.answer_id})
+        self.assertIn(b'["Already voted"]', response.content)
+
+        call_command('drain_votes', stdout=StringIO())
+        self.assertEqual(self.client.get(self.status_url).data['status'], 'recorded')
+        self.assertEqual(PendingVote.objects.count(), 0)
+        self.assertEqual(VoteTally.objects.get(answer_id=self.answer_id).count, 1)
+        response = self.client.post(self.url, data={'answer': self.answer_id})
+        self.assertIn(b'["Already voted"]', response.content)
+
+    def test_rejected_vote(self):
+        """
+        проверяет отклонение голоса из очереди, если голос уже записан напрямую
+        """
+        self.client.post(self.url, data={'answer': self.answer_id})
+        Vote.objects.create(user=User.objects.get(), question_id=self.question_id,
+                            answer_id=self.answer_id)
+        call_command('drain_votes', stdout=StringIO())
+        self.assertEqual(self.client.get(self.status_url).data['status'], 'recorded')
+        self.assertEqual(PendingVote.objects.get().state, PendingVote.REJECTED)
+
+
+class ImportVotesTest(APITestCase):
+    def setUp(self):
+        create_account()
+        self.question_id, self.answer_id = create_question(-1)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as source:
+            source.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_import_ndjson(self):
+        """
+        проверяет импорт голосов порциями, запись отказов и продолжение со смещения
+        """
+        User.objects.create(username='kiosk')
+        vote = '{{"username": "{}", "question": {}, "answer": {}}}'
+        path = self.write('votes.ndjson', [
+            vote.format('test_account', self.question_id, self.answer_id),
+            vote.format('test_account', self.question_id, self.answer_id),
+            vote.format('kiosk', self.question_id, self.answer_id + 1),
+            'not json',
+            vote.format('kiosk', self.question_id, self.answer_id),
+        ])
+        output = StringIO()
+        call_command('import_votes', path, chunk_size=2, stdout=output)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(VoteTally.objects.get(answer_id=self.answer_id).count, 2)
+        with open(path + '.rejects') as rejects:
+            reasons = [json.loads(line)['reason'] for line in rejects]
+        self.assertEqual(reasons[:2], ['Already voted', 'Answer is not valid'])
+        self.assertEqual(len(reasons), 3)
+
+        # повторный запуск с последнего смещения ничего не импортирует
+        offset = int(output.getvalue().splitlines()[-2].split()[0].split('=')[1])
+        self.assertEqual(offset, os.path.getsize(path))
+        call_command('import_votes', path, offset=offset, stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_import_csv(self):
+        """
+        проверяет импорт голосов из CSV и проверку активности опроса по времени голоса
+        """
+        user_id = User.objects.get().id
+        path = self.write('votes.csv', [
+            'user,question,answer,created',
+            '{},{},{},2000-01-01T00:00:00Z'.format(user_id, self.question_id, self.answer_id),
+            '{},{},{},'.format(user_id, self.question_id, self.answer_id),
+        ])
+        call_command('import_votes', path, stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 1)
+        with open(path + '.rejects') as rejects:
+            self.assertEqual(json.loads(rejects.readline())['reason'], 'Question is not active')
+
+
+class BenchmarkTest(APITestCase):
+    def test_generate_and_benchmark(self):
+        """
+        проверяет генерацию синтетических данных и замеры по всем адресам сервиса
+        """
+        call_command('generate_load_data', questions=3, answers=2, users=20, votes=30,
+                     seed=1, stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 3)
+        self.assertEqual(Vote.objects.count(), 30)
+        self.assertEqual(QuestionTally.objects.get(question__title='bench_0').total,
+                         Vote.objects.filter(question__title='bench_0').count())
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', iterations=1, warmup=0, stdout=StringIO())
+        call_command('run_benchmarks', iterations=2, warmup=0, output=path, i_know_this_writes=True,
+                     stdout=StringIO())
+        with open(path) as source:
+            results = json.load(source)
+        self.assertEqual(set(results['endpoints']), {
+            'login', 'sign-on', 'bulk_provision', 'questions', 'question_details', 'vote',
+            'ballot', 'vote_status', 'statistics', 'timeseries', 'results_stream', 'statistics_export',
+            'votes_export', 'vote_feed', 'metrics'})
+        for name, result in results['endpoints'].items():
+            self.assertLess(int(max(result['statuses'])), 300, name)
+            self.assertGreaterEqual(result['p99_ms'], result['p50_ms'])
+
+        output = StringIO()
+        call_command('run_benchmarks', iterations=1, warmup=0, endpoint=['questions'],
+                     compare=path, i_know_this_writes=True, stdout=output)
+        self.assertIn('p50_ms', output.getvalue().splitlines()[-1])
+
+
+class QueryBudgetTest(APITestCase):
+    def test_budgets_constant_in_rows(self):
+        """
+        проверяет бюджеты SQL запросов всех адресов на нескольких объемах данных
+        """
+        client = Client()
+        for questions in (1, 10, 50):
+            call_command('generate_load_data', questions=questions, answers=3, users=questions * 2 + 10,
+                         votes=questions * 5, seed=questions, stdout=StringIO())
+            scenarios = build_scenarios(2)
+            self.assertEqual({scenario.name for scenario in scenarios}, set(QUERY_BUDGETS))
+            for scenario in scenarios:
+                for i in range(2):
+                    cache.clear()
+                    token_cache.clear()
+                    with query_budget(scenario.name):
+                        response = scenario.request(client, i)
+                    self.assertLess(response.status_code, 300, scenario.name)
+
+    def test_budget_exceeded(self):
+        """
+        проверяет, что превышение бюджета перечисляет выполненные запросы
+        """
+        create_account()
+        create_question(1)
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with query_budget('questions', budget=1):
+                list(Question.objects.all())
+                list(Answer.objects.all())
+        message = str(context.exception)
+        self.assertIn('2 queries executed, budget is 1', message)
+        self.assertIn('polls_answer', message)
+
+
+class MetricsTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        registry.reset()
+        self.addCleanup(registry.reset)
+        token = create_account()
+        User.objects.update(is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        create_question(1)
+
+    def test_server_timing(self):
+        """
+        проверяет заголовок Server-Timing с временем и числом SQL запросов
+        """
+        token_cache.clear()
+        response = self.client.get(reverse('polls:questions'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+    def test_metrics_across_workers(self):
+        """
+        проверяет, что /metrics/ суммирует метрики из файлов всех воркеров
+        """
+        with override_settings(POLLS_METRICS_DIR=self.directory):
+            self.client.get(reverse('polls:questions'))
+            self.client.get(reverse('polls:questions'))
+            # снимок другого воркера
+            with open(os.path.join(self.directory, '1.json'), 'w') as output:
+                json.dump(registry.snapshot(), output)
+            response = self.client.get(reverse('polls:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('polls_request_duration_seconds_count{view="polls:questions",method="GET"} 4', body)
+        self.assertIn('polls_responses_total{view="polls:questions",method="GET",status="200"} 4', body)
+        self.assertIn('polls_response_bytes_total{view="polls:questions",method="GET"}', body)
+        self.assertIn('polls_token_cache_requests_total{result="hit"}', body)
+
+    def test_retired_worker_metrics(self):
+        """
+        проверяет, что метрики завершившегося воркера переносятся в общий файл,
+        а при запуске сервера каталог очищается
+        """
+        with override_settings(POLLS_METRICS_DIR=self.directory):
+            self.client.get(reverse('polls:questions'))
+            for pid in (1, 2):
+                with open(os.path.join(self.directory, '{}.json'.format(pid)), 'w') as output:
+                    json.dump(registry.snapshot(), output)
+                retire_worker(pid)
+            self.assertEqual(sorted(os.listdir(self.directory)), [EXITED_FILE])
+            body = self.client.get(reverse('polls:metrics')).content.decode()
+            self.assertIn('polls_responses_total{view="polls:questions",method="GET",status="200"} 3',
+                          body)
+            clear_metrics_dir()
+            self.assertEqual(os.listdir(self.directory), [])
+
+    def test_metrics_for_admins_only(self):
+        """
+        проверяет, что метрики недоступны обычному пользователю
+        """
+        User.objects.update(is_staff=False)
+        token_cache.clear()
+        response = self.client.get(reverse('polls:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ProfilingTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        token = create_account()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        create_question(1)
+
+    def test_disabled(self):
+        """
+        проверяет, что выключенное профилирование не подключает middleware
+        """
+        with override_settings(POLLS_PROFILE_RATE=0, POLLS_PROFILE_TOKEN=None):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_profile_by_header(self):
+        """
+        проверяет профилирование запроса с заголовком и ротацию профилей
+        """
+        with override_settings(POLLS_PROFILE_TOKEN='secret', POLLS_PROFILE_DIR=self.directory,
+                               POLLS_PROFILE_KEEP=2):
+            names = []
+            for _ in range(3):
+                response = self.client.get(reverse('polls:questions'), HTTP_X_PROFILE='secret')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                names.append(response['X-Profile-File'])
+            response = self.client.get(reverse('polls:questions'), HTTP_X_PROFILE='wrong')
+            self.assertNotIn('X-Profile-File', response)
+        self.assertIn('polls.questions', names[0])
+        self.assertEqual(sorted(os.listdir(self.directory)), names[1:])
+        stats = pstats.Stats(os.path.join(self.directory, names[-1]))
+        self.assertTrue(stats.total_calls)
+
+
+@override_settings(POLLS_DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(APITestCase):
+    multi_db = True
+
+    def setUp(self):
+        token = create_account()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.question_id, self.answer_id = create_question(-1)
+        # копирование строк в реплику вместо репликации
+        for model in (User, Token, Question, Answer):
+            model.objects.using('replica').bulk_create(model.objects.using('default'))
+        cache.clear()
+
+    def test_reads_from_replica(self):
+        """
+        проверяет, что списки читаются с реплики, а запись идет в основную БД
+        """
+        new_id = create_question(-2)[0]
+        # сразу после сброса набор активных опросов строится по основной БД
+        response = self.client.get(reverse('polls:questions'))
+        self.assertEqual([question['id'] for question in response.data['results']],
+                         [self.question_id, new_id])
+
+        cache.clear()
+        response = self.client.get(reverse('polls:questions'))
+        self.assertEqual([question['id'] for question in response.data['results']],
+                         [self.question_id])
+
+    def test_auth_reads_primary(self):
+        """
+        проверяет, что токен проверяется по основной БД: удаленный токен
+        не принимается, а новый пользователь проходит аутентификацию сразу
+        """
+        Token.objects.using('default').delete()
+        response = self.client.get(reverse('polls:questions'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials()
+        response = self.client.post(reverse('polls:sign-on'),
+                                    {'username': 'new_account', 'password': 'pass12345'})
+        token = response.data['token']
+        self.assertTrue(cache.get(credential_pin_key('Token ' + token)))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.get(reverse('polls:questions'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_read_your_writes(self):
+        """
+        проверяет, что после голосования пользователь читает из основной БД
+        """
+        status_url = reverse('polls:vote_status', kwargs={'pk': self.question_id})
+        response = self.client.post(reverse('polls:vote', kwargs={'pk': self.question_id}),
+                                    {'answer': self.answer_id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Vote.objects.using('default').count(), 1)
+        self.assertEqual(Vote.objects.using('replica').count(), 0)
+        self.assertEqual(self.client.get(status_url).data['status'], 'recorded')
+
+        # по истечении закрепления чтение снова идет с отстающей реплики
+        cache.clear()
+        self.assertEqual(self.client.get(status_url).data['status'], 'none')
+
+
+class ArchiveTest(APITestCase):
+    def setUp(self):
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.closed_id, self.closed_answer_id = create_question(-10)
+        self.active_id, self.active_answer_id = create_question(-1)
+        users = [User.objects.create(username='voter{}'.format(i)) for i in range(3)]
+        create_votes([Vote(user=user, question_id=self.closed_id, answer_id=self.closed_answer_id)
+                      for user in users])
+        create_votes([Vote(user=users[0], question_id=self.active_id,
+                           answer_id=self.active_answer_id)])
+
+    def test_archive_polls(self):
+        """
+        проверяет фиксацию итогов закрытого опроса и перенос его голосов порциями
+        """
+        call_command('archive_polls', batch_size=2, stdout=StringIO())
+        self.assertEqual(AnswerSnapshot.objects.get(answer_id=self.closed_answer_id).count, 3)
+        self.assertFalse(Vote.objects.filter(question_id=self.closed_id).exists())
+        self.assertEqual(ArchivedVote.objects.filter(question_id=self.closed_id).count(), 3)
+        self.assertFalse(VoteTally.objects.filter(question_id=self.closed_id).exists())
+        self.assertEqual(vote_status(User.objects.get(username='voter0'), self.closed_id),
+                         'recorded')
+        self.assertEqual(Vote.objects.filter(question_id=self.active_id).count(), 1)
+
+        # пересчет не восстанавливает счетчики архивированного опроса
+        call_command('rebuild_tallies', verify=True, stdout=StringIO())
+        call_command('rebuild_tallies', stdout=StringIO())
+        self.assertFalse(VoteTally.objects.filter(question_id=self.closed_id).exists())
+
+        response = self.client.get(reverse('polls:votes_export', kwargs={'fmt': 'ndjson'}))
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+    def test_statistic_merges_snapshots(self):
+        """
+        проверяет, что статистика объединяет итоги архивированных опросов со счетчиками
+        """
+        call_command('archive_polls', stdout=StringIO())
+        url = reverse('polls:statistics')
+        first = self.client.get(url, {'page_size': 1}).data
+        second = self.client.get(first['next']).data
+        rows = first['results'] + second['results']
+        self.assertEqual([(row['question'], row['total']) for row in rows],
+                         [(self.closed_id, 3), (self.active_id, 1)])
+        self.assertIsNone(second['next'])
+
+
+@override_settings(POLLS_LIVE_POLL_INTERVAL=0.01, POLLS_LIVE_RATE=100, POLLS_LIVE_MAX_SECONDS=5)
+class ResultStreamTest(APITestCase):
+    def setUp(self):
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.question_id, self.answer_id = create_question(-1)
+        self.url = reverse('polls:results_stream', kwargs={'pk': self.question_id})
+
+    def read_event(self, events):
+        name, data = next(events).decode().splitlines()[:2]
+        return name.split(': ')[1], json.loads(data.split(': ', 1)[1])
+
+    def test_stream(self):
+        """
+        проверяет начальное событие и изменения от публикации в процессе и из БД
+        """
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        events = iter(response.streaming_content)
+        self.assertTrue(next(events).startswith(b'retry:'))
+        self.assertEqual(self.read_event(events), ('snapshot', {
+            'question': self.question_id, 'counts': {str(self.answer_id): 0}, 'total': 0}))
+
+        # голос, записанный этим процессом
+        broker.publish(self.question_id, {self.answer_id: 1})
+        self.assertEqual(self.read_event(events), ('tally', {
+            'question': self.question_id, 'deltas': {str(self.answer_id): 1}, 'total': 1}))
+
+        # голоса другого воркера видны по счетчикам в БД
+        VoteTally.objects.filter(answer_id=self.answer_id).update(count=3)
+        self.assertEqual(self.read_event(events), ('tally', {
+            'question': self.question_id, 'deltas': {str(self.answer_id): 2}, 'total': 3}))
+        response.close()
+
+    def test_unknown_question(self):
+        """
+        проверяет ответ для несуществующего опроса
+        """
+        response = self.client.get(reverse('polls:results_stream', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FastSerializerTest(APITestCase):
+    def setUp(self):
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.question_id, self.answer_id = create_question(-1)
+        Answer.objects.create(question_id=self.question_id, answer_text='второй \u2028')
+        create_question(-2)
+        self.client.post(reverse('polls:vote', kwargs={'pk': self.question_id}),
+                         {'answer': self.answer_id})
+
+    def test_byte_compatible(self):
+        """
+        проверяет, что ответы быстрого пути побайтно совпадают с выводом сериализаторов DRF
+        """
+        render = JSONRenderer().render
+        context = {'votes': {self.question_id: self.answer_id}}
+        questions = Question.objects.order_by('pub_date', 'id')
+        response = self.client.get(reverse('polls:questions'))
+        self.assertEqual(response.content, render({
+            'next': None, 'previous': None,
+            'results': QuestionListSerializer(questions, many=True, context=context).data}))
+
+        response = self.client.get(reverse('polls:question_details', kwargs={'pk': self.question_id}))
+        self.assertEqual(response.content, render(
+            QuestionSerializer(Question.objects.get(pk=self.question_id), context=context).data))
+
+        rows = VoteTally.objects.filter(count__gt=0).values(
+            'question', 'question__title', 'answer__answer_text', 'answer'
+        ).annotate(total=F('question__tally__total'), per_answer=F('count'))
+        response = self.client.get(reverse('polls:statistics'))
+        self.assertEqual(response.content, render({
+            'next': None, 'previous': None,
+            'results': StatisticSerializer(rows, many=True).data}))
+
+    def test_benchmark(self):
+        """
+        проверяет сравнение сериализаторов на синтетических строках
+        """
+        results = benchmark_serializers(sizes=(50,), repeat=1)
+        self.assertEqual(set(results), {'questions_50', 'statistics_50'})
+
+
+class VoteFeedTest(APITestCase):
+    def setUp(self):
+        token = create_account(True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.url = reverse('polls:vote_feed')
+        self.user = User.objects.get()
+        created = now() - timedelta(minutes=1)
+        self.votes = []
+        for days in (-1, -2, -3):
+            question_id, answer_id = create_question(days)
+            self.votes.append(Vote.objects.create(user=self.user, question_id=question_id,
+                                                  answer_id=answer_id, created=created).id)
+        Vote.objects.update(recorded=created)
+
+    def test_feed(self):
+        """
+        проверяет выдачу голосов после курсора порциями, включая архивные голоса,
+        и задержку свежих голосов
+        """
+        vote = Vote.objects.get(id=self.votes[1])
+        vote.delete()
+        ArchivedVote.objects.create(id=self.votes[1], user=self.user, question_id=vote.question_id,
+                                    answer_id=vote.answer_id, created=vote.created)
+        question_id, answer_id = create_question(-4)
+        # голос из очереди записывается с прежним временем голосования
+        Vote.objects.create(user=self.user, question_id=question_id, answer_id=answer_id,
+                            created=now() - timedelta(hours=1))
+
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual([vote['id'] for vote in response.data['votes']], self.votes[:2])
+        self.assertEqual(response.data['votes'][1]['question'], vote.question_id)
+        response = self.client.get(self.url, {'since': response.data['cursor']})
+        # голос, записанный позже POLLS_FEED_GRACE назад, еще не отдается
+        self.assertEqual([vote['id'] for vote in response.data['votes']], self.votes[2:])
+        self.assertEqual(response.data['cursor'], self.votes[2])
+        response = self.client.get(self.url, {'since': self.votes[2]})
+        self.assertEqual((response.data['votes'], response.data['cursor']), ([], self.votes[2]))
+
+    @override_settings(POLLS_FEED_POLL_INTERVAL=0.01)
+    def test_long_poll(self):
+        """
+        проверяет ожидание новых голосов и отказ для неверных параметров
+        """
+        response = self.client.get(self.url, {'since': self.votes[-1], 'wait': 0.05})
+        self.assertEqual(response.data['votes'], [])
+        response = self.client.get(self.url, {'since': -1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command(self):
+        """
+        проверяет вывод ленты голосов командой vote_feed
+        """
+        output = StringIO()
+        call_command('vote_feed', since=self.votes[0], batch_size=1, stdout=output)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['id'] for line in lines], self.votes[1:])
+
+
+class MmapCacheTest(APITestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cache.mmap')
+        self.options = {'OPTIONS': {'TABLES': [(256, 8), (4096, 2)], 'WAYS': 4}}
+        self.cache = MmapCache(self.path, self.options)
+
+    def test_operations(self):
+        """
+        проверяет операции кэша, перенос значения между таблицами и срок жизни
+        """
+        self.cache.set('key', 1)
+        self.assertEqual(self.cache.get('key'), 1)
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.incr('key', 4), 5)
+        self.cache.set('key', 'x' * 1000)
+        self.assertEqual(self.cache.get('key'), 'x' * 1000)
+        self.cache.set('key', 'y')
+        self.assertEqual(self.cache.get('key'), 'y')
+        # значение больше самого крупного слота не кэшируется
+        self.cache.set('key', 'z' * 5000)
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('expired', 1, 0)
+        self.assertFalse(self.cache.has_key('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+        self.cache.delete('expired')
+        self.assertEqual(self.cache.get('expired', 'default'), 'default')
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_lru_eviction(self):
+        """
+        проверяет, что при переполнении набора вытесняется давно не использованная запись
+        """
+        cache = MmapCache(self.path, {'OPTIONS': {'TABLES': [(256, 2)], 'WAYS': 2}})
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), 3)
+
+    def test_shared_between_processes(self):
+        """
+        проверяет, что записи другого процесса видны через общий файл
+        """
+        self.cache.set('shared', None)
+        child = multiprocessing.Process(
+            target=MmapCache(self.path, self.options).set, args=('shared', 'child'))
+        child.start()
+        child.join()
+        self.assertEqual(self.cache.get('shared'), 'child')
+
+    def test_shared_between_threads(self):
+        """
+        проверяет, что экземпляры кэша потоков используют один дескриптор
+        файла и исключают друг друга при записи в набор
+        """
+        self.cache.set('counter', 0)
+        caches = [MmapCache(self.path, self.options) for _ in range(8)]
+
+        def increment(cache):
+            for _ in range(200):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=increment, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 1600)
+        self.assertEqual({cache.mapping.fd for cache in caches}, {self.cache.mapping.fd})
+
+    def test_refuses_symlink(self):
+        """
+        проверяет, что кэш не открывает файл по символической ссылке
+        """
+        target = self.path + '.target'
+        open(target, 'wb').close()
+        link = self.path + '.link'
+        os.symlink(target, link)
+        with self.assertRaises(OSError):
+            MmapCache(link, self.options).get('key')
+
+    def test_benchmark(self):
+        """
+        проверяет сравнение кэшей locmem, файлового и mmap
+        """
+        results = benchmark_caches(operations=20, value_sizes=(100,))
+        self.assertEqual(results['mmap_shared'], True)
+        self.assertEqual(results['locmem_shared'], False)
+        self.assertIn('get_us', results['file_100'])
+
+
+class AdminTest(APITestCase):
+    def setUp(self):
+        create_account(True)
+        User.objects.update(is_staff=True)
+        self.client.force_login(User.objects.get())
+        self.url = reverse('admin:polls_vote_changelist')
+        self.questions = [create_question(-1) for _ in range(7)]
+
+    def add_votes(self, count):
+        for _ in range(count):
+            question_id, answer_id = self.questions.pop()
+            user = User.objects.create(username='voter_{}'.format(User.objects.count()))
+            Vote.objects.create(user=user, question_id=question_id, answer_id=answer_id)
+
+    def test_vote_changelist(self):
+        """
+        проверяет, что число запросов списка голосов в админке не растет с числом голосов
+        """
+        self.add_votes(2)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        question_id = self.questions[-1][0]
+        self.add_votes(5)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(many), len(few))
+        response = self.client.get(self.url, {'question__id__exact': question_id})
+        self.assertContains(response, 'voter_', count=1)
+        yesterday = (now() - timedelta(days=1)).isoformat()
+        response = self.client.get(self.url, {'created__gte': yesterday})
+        self.assertContains(response, 'voter_', count=7)
+        response = self.client.get(self.url, {'created__lt': yesterday})
+        self.assertNotContains(response, 'voter_')
+
+    def test_estimated_count(self):
+        """
+        проверяет точный подсчет без статистики PostgreSQL и поиск пользователей по началу имени
+        """
+        self.add_votes(3)
+        paginator = EstimatedCountPaginator(Vote.objects.order_by('-pk'), 100)
+        self.assertIsNone(estimated_count(Vote, 'default'))
+        self.assertEqual(paginator.count, 3)
+        response = self.client.get(reverse('admin:auth_user_changelist'), {'q': 'voter_'})
+        self.assertContains(response, '3 users')
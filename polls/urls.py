@@ -2,17 +2,38 @@ from django.conf.urls import url
 from rest_framework.authtoken.views import obtain_auth_token
 from .views import (QuestionDetails,
                     VoteView,
+                    BallotView,
+                    VoteStatusView,
                     QuestionList,
                     RegisterUser,
-                    StatisticView)
+                    BulkProvisionView,
+                    StatisticView,
+                    ExportView,
+                    TimeSeriesView,
+                    ResultStreamView,
+                    VoteFeedView,
+                    MetricsView)
 
 
 app_name = 'polls'
 urlpatterns = [
     url(r'^get-auth-token/', obtain_auth_token, name='login'),
     url(r'^sign-on/', RegisterUser.as_view(), name='sign-on'),
+    url(r'^users/bulk/$', BulkProvisionView.as_view(), name='bulk_provision'),
     url(r'^questions/$', QuestionList.as_view(), name='questions'),
     url(r'^questions/(?P<pk>\d+)/$', QuestionDetails.as_view(), name='question_details'),
     url(r'^questions/(?P<pk>\d+)/vote/$', VoteView.as_view(), name='vote'),
+    url(r'^questions/(?P<pk>\d+)/vote/status/$', VoteStatusView.as_view(), name='vote_status'),
+    url(r'^ballot/$', BallotView.as_view(), name='ballot'),
     url(r'^questions/statistics/$', StatisticView.as_view(), name='statistics'),
+    url(r'^questions/(?P<pk>\d+)/statistics/timeseries/$', TimeSeriesView.as_view(),
+        name='timeseries'),
+    url(r'^questions/(?P<pk>\d+)/results/stream/$', ResultStreamView.as_view(),
+        name='results_stream'),
+    url(r'^questions/statistics/export/(?P<fmt>csv|ndjson)/$', ExportView.as_view(),
+        {'dataset': 'statistics'}, name='statistics_export'),
+    url(r'^votes/export/(?P<fmt>csv|ndjson)/$', ExportView.as_view(),
+        {'dataset': 'votes'}, name='votes_export'),
+    url(r'^votes/feed/$', VoteFeedView.as_view(), name='vote_feed'),
+    url(r'^metrics/$', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,19 +1,49 @@
 # -*- coding: utf-8 -*-
-from django.db.models import F, Count
-from django.db.models.expressions import Window
+import heapq
+from hashlib import md5
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import http_date, quote_etag
 from django.utils.timezone import localtime, now
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (ListAPIView,
                                      RetrieveAPIView,
                                      CreateAPIView)
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import Question, Vote
+from .caching import get_active_questions
+from .export import CONTENT_TYPES, export, render_ndjson
+from .feed import FEED_FIELDS, wait_feed
+from .ingestion import BALLOT_MAX_SIZE, active_votes, cast_ballot, is_buffered, vote_status
+from .live import broker, publish_votes, stream_results
+from .mappers import RowMapper
+from .metrics import render_metrics
+from .models import AnswerSnapshot, Question, VoteTally
+from .pagination import QuestionPagination, StatisticPagination
 from .permissions import ClientPermission
-from .serializers import (QuestionSerializer,
+from .provisioning import BULK_PROVISION_MAX_SIZE, provision_users
+from .rollups import get_timeseries
+from .serializers import (BallotItemSerializer,
+                          FeedQuerySerializer,
+                          FeedVoteSerializer,
+                          PendingVoteSerializer,
+                          QuestionSerializer,
                           QuestionListSerializer,
                           StatisticSerializer,
+                          TimeSeriesQuerySerializer,
+                          TimeSeriesSerializer,
                           VoteSerializer,
                           UserSerialization)
+from .tallies import record_votes
 
 
 def current_time():
@@ -23,20 +53,145 @@ def current_time():
     return localtime(now())
 
 
-class QuestionList(ListAPIView):
+class ConditionalGetMixin(object):
+    """
+    Добавляет к ответу ETag и Last-Modified по версии ресурса и отвечает 304
+    без сериализации, если версия, известная клиенту, не изменилась
+    """
+    def get_version(self):
+        """
+        Возвращает пару (версия, время изменения) или None, если ресурс не найден
+        """
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+
+        version, modified = version
+        # разные форматы ответа (json, browsable api) и страницы - разные представления ресурса
+        etag = quote_etag(md5('{}:{}:{}'.format(
+            version, request.accepted_renderer.format, request.GET.urlencode()).encode()).hexdigest())
+        last_modified = modified and int(modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ActiveQuestionsMixin(object):
+    """
+    Предоставляет представлению набор активных опросов, загружаемый из кэша
+    один раз за запрос
+    """
+    @cached_property
+    def active_questions(self):
+        return get_active_questions(current_time())
+
+
+class UserVotesMixin(object):
+    """
+    Голоса пользователя в активных опросах поверх общего кэшированного набора:
+    один запрос за запрос к представлению
+    """
+    # поля voted и my_answer заполняются в apply_vote
+    row_overrides = {'voted': lambda row: False, 'my_answer': lambda row: None}
+
+    @cached_property
+    def user_votes(self):
+        return active_votes(self.request.user, current_time())
+
+    def get_serializer_context(self):
+        context = super(UserVotesMixin, self).get_serializer_context()
+        context['votes'] = {question_id: answer_id
+                            for question_id, (answer_id, _) in self.user_votes.items()}
+        return context
+
+    def vote_version(self, version, modified, question_ids):
+        """
+        Добавляет к версии и времени изменения опросов голоса пользователя
+        в question_ids: после голосования меняются ETag и Last-Modified
+        """
+        votes = [(question_id, answer_id, created)
+                 for question_id, (answer_id, created) in sorted(self.user_votes.items())
+                 if question_id in question_ids]
+        times = [created for _, _, created in votes if created is not None]
+        if times:
+            modified = max(times + [modified] if modified else times)
+        return '{}:{}'.format(version, [vote[:2] for vote in votes]), modified
+
+    def apply_vote(self, item, question_id):
+        vote = self.user_votes.get(question_id)
+        item['voted'] = vote is not None
+        item['my_answer'] = None if vote is None else vote[0]
+        return item
+
+
+class QuestionList(ConditionalGetMixin, ActiveQuestionsMixin, UserVotesMixin, ListAPIView):
     """
     Представление возвращающее список всех активных на текущее время опросов
     """
-    queryset = Question.objects.filter(date_start__lt=current_time(), date_end__gt=current_time())
     serializer_class = QuestionListSerializer
+    pagination_class = QuestionPagination
+    row_mapper = RowMapper(QuestionListSerializer, **UserVotesMixin.row_overrides)
 
+    def get_version(self):
+        # Last-Modified списка не отправляется: набор меняется и без изменения
+        # опросов (начало и конец опроса по времени, удаление), а секундной
+        # точности заголовка не хватает, чтобы отличить наборы, построенные
+        # в одну секунду. Состав набора учитывается в версии для ETag
+        version, _ = self.vote_version(self.active_questions['version'], None,
+                                       self.active_questions['index'])
+        return version, None
 
-class QuestionDetails(RetrieveAPIView):
+    def get_queryset(self):
+        return self.active_questions['questions']
+
+    def list(self, request, *args, **kwargs):
+        # ответ собирается без сериализатора, вывод совпадает с serializer_class
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            # постраничный вывод отключен (POLLS_PAGE_SIZE пуст), набор уже упорядочен
+            return Response([self.apply_vote(item, item['id'])
+                             for item in self.row_mapper.many(queryset)])
+        return self.get_paginated_response([
+            self.apply_vote(item, item['id']) for item in self.row_mapper.many(page)])
+
+
+class QuestionDetails(ConditionalGetMixin, ActiveQuestionsMixin, UserVotesMixin, RetrieveAPIView):
     """
     Представление возвращающее детализациою опроса
     """
-    queryset = Question.objects.filter(date_start__lt=current_time(), date_end__gt=current_time())
     serializer_class = QuestionSerializer
+    row_mapper = RowMapper(QuestionSerializer, **UserVotesMixin.row_overrides)
+
+    def get_version(self):
+        question = self.active_questions['index'].get(int(self.kwargs['pk']))
+        if question is not None:
+            return self.vote_version('{}:{}'.format(question.id, question.modified.timestamp()),
+                                     question.modified, {question.id})
+
+    def get_queryset(self):
+        return self.active_questions['questions']
+
+    def get_object(self):
+        question = self.active_questions['index'].get(int(self.kwargs['pk']))
+        if question is None:
+            raise Http404
+        self.check_object_permissions(self.request, question)
+        return question
+
+    def retrieve(self, request, *args, **kwargs):
+        question = self.get_object()
+        return Response(self.apply_vote(self.row_mapper(question), question.id))
 
 
 class VoteView(CreateAPIView):
@@ -46,18 +201,69 @@ class VoteView(CreateAPIView):
     serializer_class = VoteSerializer
     permission_classes = (IsAuthenticated,)
 
-    def get_object(self):
-        if self.kwargs:
-            self.object = Question.objects.get(pk=self.kwargs['pk'])
-            return self.object
+    def get_serializer_class(self):
+        if is_buffered():
+            return PendingVoteSerializer
+        return self.serializer_class
 
     def get_serializer_context(self):
         context = super(VoteView, self).get_serializer_context()
-        context['question'] = self.get_object()
+        # опрос не загружается: его существование и активность проверяются
+        # вместе с вариантом ответа в VoteSerializer.validate
+        context['question_id'] = int(self.kwargs['pk'])
         return context
 
+    def create(self, request, *args, **kwargs):
+        response = super(VoteView, self).create(request, *args, **kwargs)
+        if is_buffered():
+            # голос принят в очередь и будет записан командой drain_votes
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
     def perform_create(self, serializer):
-        serializer.save(question=self.object, user=self.request.user)
+        if is_buffered():
+            serializer.save(question_id=int(self.kwargs['pk']), user=self.request.user)
+            return
+        # голос и счетчики статистики записываются в одной транзакции
+        with transaction.atomic():
+            vote = serializer.save(question_id=int(self.kwargs['pk']), user=self.request.user)
+            record_votes([(vote.question_id, vote.answer_id)])
+            transaction.on_commit(
+                lambda: broker.publish(vote.question_id, {vote.answer_id: 1}))
+
+
+class BallotView(APIView):
+    """
+    Представление реализующее голосование сразу в нескольких опросах.
+    Принимает список объектов с question и answer (не больше
+    BALLOT_MAX_SIZE), голоса записываются в одной транзакции,
+    для каждой пары возвращается результат: ошибка одной пары
+    не отменяет остальные
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = BallotItemSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+        if not 0 < len(items) <= BALLOT_MAX_SIZE:
+            raise ValidationError('Expected from 1 to {} votes'.format(BALLOT_MAX_SIZE))
+        with transaction.atomic():
+            results, created = cast_ballot(request.user, items)
+            if not is_buffered():
+                transaction.on_commit(lambda: publish_votes(created))
+        return Response({'results': results})
+
+
+class VoteStatusView(APIView):
+    """
+    Представление возвращающее состояние голоса пользователя в опросе:
+    recorded, pending (в очереди на запись), rejected или none
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk):
+        return Response({'question': int(pk), 'status': vote_status(request.user, pk)})
 
 
 class RegisterUser(CreateAPIView):
@@ -68,29 +274,173 @@ class RegisterUser(CreateAPIView):
     permission_classes = (AllowAny,)
 
 
-class StatisticView(ListAPIView):
+class BulkProvisionView(APIView):
+    """
+    Представление реализующее массовую регистрацию пользователей,
+    доступно только администраторам. Принимает список объектов
+    с username и password (не больше BULK_PROVISION_MAX_SIZE), пользователи
+    создаются до ответа, выданные токены возвращаются в NDJSON.
+    Большие списки загружаются командой provision_users
+    """
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request):
+        records = request.data
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValidationError('Expected a list of objects with username and password')
+        if len(records) > BULK_PROVISION_MAX_SIZE:
+            raise ValidationError('Expected at most {} users'.format(BULK_PROVISION_MAX_SIZE))
+        results = list(provision_users((record.get('username'), record.get('password'))
+                                       for record in records))
+        return StreamingHttpResponse(render_ndjson(None, results),
+                                     content_type=CONTENT_TYPES['ndjson'])
+
+
+class StatisticView(ConditionalGetMixin, ListAPIView):
     """
     Представление реализующее сбор статистики по всем опросам,
     доступно только клиентам
     """
-    queryset = Vote.objects.all()
+    queryset = VoteTally.objects.all()
     serializer_class = StatisticSerializer
     permission_classes = [ClientPermission, ]
+    pagination_class = StatisticPagination
+    row_mapper = RowMapper(StatisticSerializer, rows='values',
+                           frequency=lambda row: round(row['per_answer'] / row['total'], 2))
+
+    def get_version(self):
+        # сумма счетчиков растет с каждым голосом, число итогов - с архивацией
+        # опросов, а время изменения опросов отражает правки заголовков и текстов ответов
+        version = Question.objects.aggregate(
+            votes=Sum('tally__total'),
+            questions=Count('tally'),
+            archived=Count('snapshot'),
+            modified=Max('modified')
+        )
+        return '{votes}:{questions}:{archived}:{modified}'.format(**version), None
 
     def get_queryset(self):
-        vote_qs = Vote.objects.annotate(
-            total=Window(
-                expression=Count('answer'),
-                partition_by=[F('question')])).annotate(
-            per_answer=Window(
-                expression=Count('answer'),
-                partition_by=[F('question'), F('answer')])
+        # читаем готовые счетчики вместо агрегирования всей таблицы голосов,
+        # итоги архивированных опросов - из их снимков
+        fields = ('question', 'question__title', 'answer__answer_text', 'answer')
+        live = VoteTally.objects.filter(count__gt=0).values(*fields).annotate(
+            total=F('question__tally__total'),
+            per_answer=F('count')
         )
+        archived = AnswerSnapshot.objects.filter(count__gt=0).values(*fields).annotate(
+            total=F('question__snapshot__total'),
+            per_answer=F('count')
+        )
+        return live, archived
+
+    def list(self, request, *args, **kwargs):
+        # round от float совпадает с выводом округленного Decimal в get_frequency
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            # постраничный вывод отключен, строки обоих источников в порядке страниц
+            ordering = StatisticPagination.ordering
+            return Response(self.row_mapper.many(heapq.merge(
+                *[part.order_by(*ordering) for part in queryset], key=itemgetter(*ordering))))
+        return self.get_paginated_response(self.row_mapper.many(page))
+
+
+class ResultStreamView(APIView):
+    """
+    Представление отдающее изменения счетчиков голосов опроса потоком
+    Server-Sent Events, доступно только клиентам
+    """
+    permission_classes = [ClientPermission, ]
+
+    def get(self, request, pk):
+        if not Question.objects.filter(pk=pk).exists():
+            raise Http404
+        response = StreamingHttpResponse(stream_results(int(pk)), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # nginx не должен буферизовать события, GZipMiddleware их пропускает
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """
+    Выбирает первый рендерер независимо от заголовка Accept: формат выгрузки
+    задается адресом, а рендерер нужен только для ответов об ошибках
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
 
-        vote_qs = vote_qs.values(
-            'question', 'question__title',
-            'answer__answer_text', 'answer',
-            'total','per_answer'
-        ).distinct().order_by('question')
 
-        return vote_qs
+class ExportView(APIView):
+    """
+    Представление реализующее потоковую выгрузку статистики или голосов
+    в CSV или NDJSON, доступно только клиентам
+    """
+    permission_classes = [ClientPermission, ]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, dataset, fmt):
+        response = StreamingHttpResponse(export(dataset, fmt), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(dataset, fmt)
+        return response
+
+
+class TimeSeriesView(APIView):
+    """
+    Представление возвращающее поминутный или почасовой ряд голосов
+    по вариантам ответа опроса, доступно только клиентам
+    """
+    permission_classes = [ClientPermission, ]
+
+    def get(self, request, pk):
+        params = TimeSeriesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        if not Question.objects.filter(pk=pk).exists():
+            raise Http404
+        query = params.validated_data
+        points = [
+            {'bucket': bucket, 'answer': answer, 'count': count}
+            for bucket, answer, count in get_timeseries(pk, query['bucket'], query['start'], query['end'])
+        ]
+        return Response({
+            'question': int(pk),
+            'bucket': query['bucket'],
+            'start': params.fields['start'].to_representation(query['start']),
+            'end': params.fields['end'].to_representation(query['end']),
+            'series': TimeSeriesSerializer(points, many=True).data,
+        })
+
+
+class VoteFeedView(APIView):
+    """
+    Представление возвращающее ленту голосов после курсора since в порядке id,
+    доступно только клиентам. Параметр wait задает, сколько секунд ждать
+    новых голосов, если их еще нет. Следующий запрос передает since=cursor
+    """
+    permission_classes = [ClientPermission, ]
+    row_mapper = RowMapper(FeedVoteSerializer, rows='values')
+
+    def get(self, request):
+        params = FeedQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        votes = wait_feed(query['since'], query['limit'], query['wait'])
+        return Response({
+            'votes': self.row_mapper.many(dict(zip(FEED_FIELDS, vote)) for vote in votes),
+            'cursor': votes[-1][0] if votes else query['since'],
+        })
+
+
+class MetricsView(APIView):
+    """
+    Представление отдающее метрики всех воркеров в текстовом формате
+    Prometheus, доступно только администраторам
+    """
+    permission_classes = (IsAdminUser,)
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,21 @@
+"""
+Хуки gunicorn: gunicorn -c python:polls_service.gunicorn_conf polls_service.wsgi
+"""
+import os
+
+
+def _metrics():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polls_service.settings')
+    import django
+    django.setup()
+    from polls import metrics
+    return metrics
+
+
+def on_starting(server):
+    # метрики прежнего запуска не должны попасть в суммы
+    _metrics().clear_metrics_dir()
+
+
+def child_exit(server, worker):
+    _metrics().retire_worker(worker.pid)
@@ -0,0 +1,19 @@
+"""
+Сервер потоков результатов /questions/<pk>/results/stream/ на воркерах gevent:
+подписчик занимает гринлет, а не поток, и один воркер держит тысячи подписчиков.
+gunicorn -c python:polls_service.gunicorn_stream_conf polls_service.wsgi
+Каталог метрик очищает основной сервер, здесь метрики завершившихся
+воркеров только переносятся в общий файл
+"""
+from polls_service.gunicorn_conf import child_exit  # noqa: F401
+
+worker_class = 'gevent'
+workers = 2
+worker_connections = 5000
+timeout = 30
+
+
+def post_fork(server, worker):
+    # запросы psycopg2 уступают управление другим гринлетам воркера
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
@@ -44,15 +44,56 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'polls.authentication.CachedTokenAuthentication',
     'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'polls.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# размер и время жизни (в секундах) кэша токенов в каждом воркере
+POLLS_TOKEN_CACHE_SIZE = 10000
+POLLS_TOKEN_CACHE_TTL = 300
+
+# размер страницы списков опросов и статистики и его предел для параметра page_size
+POLLS_PAGE_SIZE = 100
+POLLS_MAX_PAGE_SIZE = 1000
+
+# режим записи голосов: direct - сразу в Vote, buffered - через очередь,
+# которую разбирает команда drain_votes
+POLLS_VOTE_INGESTION = 'direct'
+
+# наибольшее число голосов в одном бюллетене /ballot/
+POLLS_BALLOT_MAX_SIZE = 100
+
+# наибольшее число пользователей в одном запросе /users/bulk/: пароли хешируются
+# в воркере до ответа, большие списки загружаются командой provision_users
+POLLS_BULK_PROVISION_MAX_SIZE = 100
+
+# каталог, в который каждый воркер сохраняет метрики запросов для /metrics/;
+# должен быть общим для воркеров. Хуки gunicorn (polls_service/gunicorn_conf.py)
+# очищают его при запуске и собирают в один файл метрики завершившихся воркеров.
+# Пустое значение - /metrics/ показывает метрики только отвечающего процесса
+POLLS_METRICS_DIR = os.environ.get('POLLS_METRICS_DIR', os.path.join(BASE_DIR, 'var', 'metrics'))
+
+# профилирование запросов: доля профилируемых запросов и секрет заголовка
+# X-Profile для профилирования отдельного запроса; если оба выключены,
+# middleware не подключается
+POLLS_PROFILE_RATE = 0
+POLLS_PROFILE_TOKEN = os.environ.get('POLLS_PROFILE_TOKEN')
+POLLS_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+POLLS_PROFILE_KEEP = 100
+
 MIDDLEWARE = [
+    'polls.metrics.MetricsMiddleware',
+    'polls.profiling.ProfilingMiddleware',
+    'polls.routers.ReplicaRoutingMiddleware',
+    'polls.live.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +138,29 @@ DATABASES = {
     }
 }
 
+# псевдонимы реплик из DATABASES для чтения в безопасных запросах и время
+# (в секундах), на которое клиент после изменяющего запроса читает из основной БД
+POLLS_DATABASE_REPLICAS = []
+POLLS_REPLICA_PIN_SECONDS = 5
+
+DATABASE_ROUTERS = ['polls.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# кэш в отображенном в память файле общий для всех воркеров хоста: сброс кэша
+# активных опросов сигналами и закрепление клиентов за основной БД видны
+# во всех процессах. При нескольких хостах нужен memcached или redis
+
+CACHES = {
+    'default': {
+        'BACKEND': 'polls.mmapcache.MmapCache',
+        # каталог проекта, а не общий /tmp: файл читается через pickle
+        'LOCATION': os.environ.get(
+            'POLLS_CACHE_FILE', os.path.join(BASE_DIR, 'var', 'polls_service.cache')),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -4,5 +4,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+    # вторая SQLite БД для проверки чтения с реплики
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    },
+}
+
+# файл общего кэша пережил бы тестовый прогон вместе с объектами
+# из тестовой БД, поэтому тесты идут на кэше в памяти процесса
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
-}
\ No newline at end of file
+}
+
+# файлы метрик других прогонов попали бы в суммы, тесты задают каталог сами
+POLLS_METRICS_DIR = None